@@ -0,0 +1,97 @@
+// Canvas of the kilobots that draws keyframes and deltas (see visualization.py).
+// Only the cells of the robots that changed are cleared and drawn again.
+const DeltaCanvasModule = function (
+  canvas_width,
+  canvas_height,
+  grid_width,
+  grid_height,
+  radius,
+  palette,
+  text_color
+) {
+  const parent = document.createElement("div");
+  parent.style.height = `${canvas_height}px`;
+  parent.className = "world-grid-parent";
+
+  const canvas = document.createElement("canvas");
+  canvas.width = canvas_width;
+  canvas.height = canvas_height;
+  canvas.className = "world-grid";
+  parent.appendChild(canvas);
+  document.getElementById("elements").appendChild(parent);
+
+  const context = canvas.getContext("2d");
+  const cellWidth = Math.floor(canvas_width / grid_width);
+  const cellHeight = Math.floor(canvas_height / grid_height);
+  const r = radius * (Math.min(cellHeight, cellWidth) / 2 - 1);
+
+  // Robot state in the browser, by row
+  let xs = null;
+  let ys = null;
+  let colors = [];
+  let texts = [];
+
+  const drawGridLines = () => {
+    context.beginPath();
+    context.strokeStyle = "#eee";
+    const maxX = cellWidth * grid_width;
+    const maxY = cellHeight * grid_height;
+    for (let y = 0; y <= maxY; y += cellHeight) {
+      context.moveTo(0, y + 0.5);
+      context.lineTo(maxX, y + 0.5);
+    }
+    for (let x = 0; x <= maxX; x += cellWidth) {
+      context.moveTo(x + 0.5, 0);
+      context.lineTo(x + 0.5, maxY);
+    }
+    context.stroke();
+  };
+
+  const drawRobot = (row) => {
+    const left = xs[row] * cellWidth;
+    const top = (grid_height - ys[row] - 1) * cellHeight;
+    context.clearRect(left + 1, top + 1, cellWidth - 1, cellHeight - 1);
+
+    const color = palette[colors[row]];
+    const cx = left + cellWidth / 2;
+    const cy = top + cellHeight / 2;
+    context.beginPath();
+    context.arc(cx, cy, r, 0, Math.PI * 2, false);
+    context.closePath();
+    context.strokeStyle = color;
+    context.stroke();
+    context.fillStyle = color;
+    context.fill();
+
+    if (texts[row]) {
+      context.fillStyle = text_color;
+      context.textAlign = "center";
+      context.textBaseline = "middle";
+      context.fillText(texts[row], cx, cy);
+    }
+  };
+
+  this.render = (frame) => {
+    if (frame.key) {
+      xs = frame.x;
+      ys = frame.y;
+      colors = frame.c;
+      texts = frame.t;
+      context.clearRect(0, 0, canvas_width, canvas_height);
+      drawGridLines();
+      for (let row = 0; row < xs.length; row++) drawRobot(row);
+      return;
+    }
+    if (xs === null) return; // Delta before any keyframe
+    frame.i.forEach((row, k) => {
+      colors[row] = frame.c[k];
+      texts[row] = frame.t[k];
+      drawRobot(row);
+    });
+  };
+
+  this.reset = () => {
+    xs = ys = null;
+    context.clearRect(0, 0, canvas_width, canvas_height);
+  };
+};
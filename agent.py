@@ -1,32 +1,72 @@
 from mesa import Agent
-import numpy as np
-import random, math
-from constant import State
+from constant import State, MessageKind, FAILURE_CHECK_PERIOD, FAILURE_CHECK_TICK
+from codec import frame_nbytes
+from messaging import MessageList
 from routines import RoutineR1, RoutineR2, RoutineR3
+from swarm import column, counter_column, broken_column, role_column, led_column, position_column
+
+
+def _snapshot(content):
+    """Copy of the lists and dicts of a payload (one level deep): like a packed frame,
+    a sent message doesn't change when its sender later updates its own tables"""
+
+    if isinstance(content, dict):
+        return {key: value.copy() if isinstance(value, (list, dict)) else value for key, value in content.items()}
+    if isinstance(content, list):
+        return [value.copy() if isinstance(value, (list, dict)) else value for value in content]
+    return content
+
 
 class Kilobot(Agent, RoutineR1, RoutineR2, RoutineR3):
+
+    # Scalar state lives in the model's swarm store (see swarm.py), the rest in slots
+    __slots__ = ("_swarm", "_row", "neighbors_count", "inbox", "neighbor_counts", "neighbor_ids",
+                 "neighbor_ids_randomNum", "neighbor_roles", "neighbor_positions", "blacklist_ids",
+                 "neighbor_rows", "neighbor_id_set", "neighbor_role_by_id", "corner_neighbor_id",
+                 "border_neighbors", "middle_neighbors",
+                 "min_dist_seen", "numOriginAssigment", "messageFromCorner", "countMessage", "sentCount",
+                 "countFullMessage", "sentFullCount", "auxPosition")
+
+    state = column("state")
+    internal_clock = column("clock")
+    my_id = column("my_id")
+    randomNumber = column("random_number")
+    role = role_column()
+    count = column("count")
+    position = position_column()
+    isBroken = broken_column()
+    led_color = led_column()
+    messages_sent_count = counter_column("messages", "messages_total")
+    message_bytes_count = counter_column("message_bytes", "message_bytes_total")
+    convergence_tick = column("converged_at")
+
     def __init__(self, unique_id, model):
         super().__init__(unique_id, model)
-        self.state = State.SR1A_ID_ASSIGNMENT # Initial state
-        self.messages_sent_count = 0
-        self.led_color = "grey"   # Initial color
-        self.role = "UNDECIDED"   # Roles: CORNER, BORDER, MIDDLE
-        self.isBroken = False  # Determine if the kilobot is broken at initialization
+        self._swarm = model.swarm
+        self._row = model.swarm.add()
+        # The scalar state starts at the defaults of a new swarm row (see SwarmState.add):
+        # state SR1A_ID_ASSIGNMENT, led_color "grey", role "UNDECIDED" (CORNER, BORDER, MIDDLE later),
+        # not broken, internal_clock 0, count 0, position [] and no messages counted
         self.neighbors_count = 0  # Number of neighbors
-        self.inbox = []           # Inbox for messages
-        self.internal_clock = 0   # Internal clock for timing phases
-        self.my_id = random.randint(1, 255)         # Initial random ID
-        self.randomNumber = random.randint(0, 255)  # Random number for ID conflict resolution
+        self.inbox = MessageList() # Inbox for messages (read by kind, see MessageChannels)
+        self.my_id = self.random.randint(1, 255)         # Initial random ID
+        self.randomNumber = self.random.randint(0, 255)  # Random number for ID conflict resolution
         self.neighbor_counts = {}  # Dict to store neighbor ID -> count
         self.neighbor_ids = []     # List of neighbor IDs
         self.neighbor_ids_randomNum = [] # List of neighbor IDs and their random numbers
         self.neighbor_roles = []   # Dict to store neighbor ID -> role
         self.neighbor_positions = [] # List of neighbor positions
-        self.blacklist_ids = []    # IDs to avoid in SR1a
+        self.blacklist_ids = set()   # IDs to avoid in SR1a
+        # Hash indexes of the neighbor tables, kept along the lists
+        self.neighbor_rows = {}       # Neighbor ID -> its row in neighbor_ids_randomNum
+        self.neighbor_id_set = set()  # neighbor_ids as a set
+        self.neighbor_role_by_id = {} # Neighbor ID -> role, as in neighbor_roles
+        # Role lookups, built at the end of SR1c (see index_neighbor_roles)
+        self.corner_neighbor_id = -1  # ID of a CORNER neighbor (-1 if none)
+        self.border_neighbors = []    # BORDER neighbors in neighbor_roles
+        self.middle_neighbors = []    # MIDDLE neighbors in neighbor_roles
         self.min_dist_seen = 9999  # Minimum distance seen in SR1b
         self.numOriginAssigment = 999999  # Number to determine the [1,1] corner 
-        self.position = []      # Global position [x,y]
-        self.count = 0          # Count for rectangle dimension setting
         self.messageFromCorner = False # Flag to indicate message from corner received
         self.countMessage = {"count": 0, "C1": 0, "C2": 0, "C3": 0} # Message for rectangle dimension
         self.sentCount = False  # Flag to avoid resending count message
@@ -43,9 +83,9 @@ class Kilobot(Agent, RoutineR1, RoutineR2, RoutineR3):
         Each robot sends its "IR" message to neighbors
         """
 
-        if self.internal_clock % 150 == 100:
+        if self.internal_clock % FAILURE_CHECK_PERIOD == FAILURE_CHECK_TICK:
             # Simulate possible failure
-            if random.random() < self.model.failure_prob:
+            if self.random.random() < self.model.failure_prob:
                 self.isBroken = True
         if self.isBroken:
             self.led_color = "brown" # Dead kilobot color
@@ -63,93 +103,96 @@ class Kilobot(Agent, RoutineR1, RoutineR2, RoutineR3):
         if self.isBroken:
             return  # Broken kilobots do nothing
 
-        # Simulated timers for phase transitions
+        # Simulated timers for phase transitions (PHASE_TIMERS in constant.py)
+        clock = self.internal_clock
 
         # ROUTINE R1
-        if self.internal_clock == 1:
+        if clock == 1:
             self.state = State.SR1A_ID_ASSIGNMENT # Assign IDs (SR1a)
             self.led_color = "grey"
 
-        elif self.internal_clock == 60:
+        elif clock == 60:
             self.state = State.SR1B_NEIGHBOR_LIST # Create neighbor list (SR1b)
             self.led_color = "lightblue"
             
-        elif self.internal_clock == 140:
+        elif clock == 140:
             self.state = State.SR1C_ROLE_ID # Collect neighbor counts (SR1c phase 1)
             self.led_color = "orange"
             
-        elif self.internal_clock == 180:
+        elif clock == 180:
             self.state = State.SR1C_SET_ROLE # Determine role (SR1c phase 2)
 
         # ROUTINE R2
-        elif self.internal_clock == 260:
+        elif clock == 260:
             self.state = State.SR2A_ORIGIN_ASSIGNMENT # Send assignment numbers from the corners (SR2a phase 1)
             self.led_color = "grey"
+            self.index_neighbor_roles()  # SR1c is over, the neighbor roles are final
 
-        elif self.internal_clock == 320:
+        elif clock == 320:
             self.state = State.SR2A_SET_ORIGIN        # The lower corner number becomes [1,1] (SR2a phase 2)
 
-        elif self.internal_clock == 370:
+        elif clock == 370:
             self.state = State.SR2A_ORIGIN_SET_POSITION # [1,1] sends positions to BORDER and MIDDLE neighbors (SR2a phase 3)
 
-        elif self.internal_clock == 400:
+        elif clock == 400:
             self.state = State.SR2B_SET_REC_DIMENSION # BORDER and CORNER has done the counting (SR2b phase 1)
 
-        elif self.internal_clock == 970:
+        elif clock == 970:
             self.state = State.SR2B_SET_RELATIVE_POS  # BORDER and CORNER set their positions (SR2b phase 2)
             self.led_color = "grey"
 
-        elif self.internal_clock == 1070:
+        elif clock == 1070:
             self.state = State.SR2C_SET_GLOBAL_POS # All robots set their global positions (SR2c)
 
         # ROUTINE R3
-        elif self.internal_clock == 1270:
+        elif clock == 1270:
             self.state = State.SET_ANIMATION_SINCRONIZATION # Synchronize animation
             
-        elif self.internal_clock == 1300:
+        elif clock == 1300:
             self.state = State.SET_ROLE_COLOR  # Every robot sets its role according to its position
 
 
         # --- Execution of each subroutine's logic --- 
         # Depending on the current state, execute the corresponding logic
-        if self.state == State.SR1A_ID_ASSIGNMENT:
+        state = self.state
+        if state == State.SR1A_ID_ASSIGNMENT:
             self.run_sr1a()
 
-        elif self.state == State.SR1B_NEIGHBOR_LIST:
+        elif state == State.SR1B_NEIGHBOR_LIST:
             self.run_sr1b()
 
-        elif self.state == State.SR1C_ROLE_ID:
+        elif state == State.SR1C_ROLE_ID:
             self.run_sr1c_collection()
 
-        elif self.state == State.SR1C_SET_ROLE:
+        elif state == State.SR1C_SET_ROLE:
             self.determine_role()
 
-        elif self.state == State.SR2A_ORIGIN_ASSIGNMENT:
+        elif state == State.SR2A_ORIGIN_ASSIGNMENT:
             self.run_sr2a_origin_assignment()
 
-        elif self.state == State.SR2A_SET_ORIGIN:
+        elif state == State.SR2A_SET_ORIGIN:
             self.setOriginAssignment()
 
-        elif self.state == State.SR2A_ORIGIN_SET_POSITION:
+        elif state == State.SR2A_ORIGIN_SET_POSITION:
             self.setOriginNeighborsPosition()
 
-        elif self.state == State.SR2B_SET_REC_DIMENSION:
+        elif state == State.SR2B_SET_REC_DIMENSION:
             self.setRecDimension()
 
-        elif self.state == State.SR2B_SET_RELATIVE_POS:
+        elif state == State.SR2B_SET_RELATIVE_POS:
             self.set_relative_position()
 
-        elif self.state == State.SR2C_SET_GLOBAL_POS:
+        elif state == State.SR2C_SET_GLOBAL_POS:
             self.set_global_position()
 
-        elif self.state == State.SET_ANIMATION_SINCRONIZATION:
+        elif state == State.SET_ANIMATION_SINCRONIZATION:
             self.set_animation_sincronization()
 
-        elif self.state == State.SET_ROLE_COLOR:
+        elif state == State.SET_ROLE_COLOR:
             self.set_role_color()
             
         # Clear inbox after processing
-        self.inbox = []
+        self.inbox = MessageList()
 
 
     
@@ -182,16 +225,10 @@ class Kilobot(Agent, RoutineR1, RoutineR2, RoutineR3):
                     break
 
 
-    def filter_neighbors_message(self):
-        """Filter neighbors messages"""
+    def filter_neighbors_message(self, kind):
+        """Messages of the given kind sent by my neighbors (filtered once per tick and kind)"""
 
-        filtered_messages = []
-        for msg in self.inbox:
-            id = msg['sender_id']
-            if id in self.neighbor_ids:
-                filtered_messages.append(msg)
-        
-        return filtered_messages
+        return self.inbox.neighbor_channel(kind, self.neighbor_id_set)
 
 
     # ---------------------------------------------------------
@@ -201,50 +238,46 @@ class Kilobot(Agent, RoutineR1, RoutineR2, RoutineR3):
     def broadcast_presence(self):
         """Simulate sending IR message to nearby neighbors"""
 
-        # Radius 3, Moore=True (includes diagonals)
-        # Simulate Kilobot's IR range, it can hear robots up to 3 units away, it can be increased if it's needed
-        # because we filter distances later
-        neighbors = self.model.grid.get_neighbors(
-            self.pos, moore=True, include_center=False, radius=3
-        )
-        
-        # The content of the message depends on the current state
+        # The content (and kind) of the message depends on the current state
         content = None
+        kind = MessageKind.EMPTY
         if self.state == State.SR1A_ID_ASSIGNMENT:
             # In SR1a, send my ID, randomNumber, and list of neighbors heard so far
-            content = {"sender_id": self.my_id, "randomNumber": self.randomNumber, "neighbors": self.neighbor_ids_randomNum}
+            # (plus the index of its rows by ID, that is not sent: the receivers rebuild it)
+            content = {"sender_id": self.my_id, "randomNumber": self.randomNumber, "neighbors": self.neighbor_ids_randomNum,
+                       "rows": self.neighbor_rows}
+            kind = MessageKind.ID_BEACON
 
         elif self.state == State.SR1B_NEIGHBOR_LIST:
             # In SR1b, just send my ID
             content = self.my_id
+            kind = MessageKind.NEIGHBOR_ID
 
         elif self.state == State.SR1C_ROLE_ID:
             # In SR1c, send the count of my neighbors
             content = len(self.neighbor_ids)
+            kind = MessageKind.NEIGHBOR_COUNT
         
         elif self.state == State.SR1C_SET_ROLE:
             content = {"id": self.my_id, "role": self.role}
+            kind = MessageKind.ROLE
 
         elif self.state == State.SR2A_ORIGIN_ASSIGNMENT or self.state == State.SR2A_SET_ORIGIN:
             # In SR2a (first and second phases), send my assigned number
             if self.role == "CORNER" and self.numOriginAssigment == 999999:
-                randomNum = random.randint(0, 200000)
+                randomNum = self.random.randint(0, 200000)
                 self.numOriginAssigment = randomNum
             content = self.numOriginAssigment
+            kind = MessageKind.ORIGIN_NUMBER
 
         elif self.state == State.SR2A_ORIGIN_SET_POSITION:
             # In SR2a (third phase), [1,1] sends positions to BORDER and MIDDLE neighbors
 
             if self.led_color == "black" and self.position == [1,1]: # Origin only sends messages to its neighbors
-                border_neighbors = []
                 content = []
-                middle_neighbors = []
-                
-                for n in self.neighbor_roles: # Identify BORDER and MIDDLE neighbors
-                    if n['id'] in self.neighbor_ids and n['role'] == "BORDER":
-                        border_neighbors.append(n)
-                    elif n['id'] in self.neighbor_ids and n['role'] == "MIDDLE":
-                        middle_neighbors.append(n)
+                # BORDER and MIDDLE neighbors, identified at the end of SR1c
+                border_neighbors = self.border_neighbors
+                middle_neighbors = self.middle_neighbors
 
                 if len(border_neighbors) < 2 or len(middle_neighbors) < 1:
                     return
@@ -256,13 +289,7 @@ class Kilobot(Agent, RoutineR1, RoutineR2, RoutineR3):
                     content = [{"id": border_neighbors[0]['id'], "position": [2,1]}, {"id": border_neighbors[1]['id'], "position": [1,2]}, {"id": middle_neighbors[0]['id'], "position": [2,2]}]
 
 
-                msg = {
-                    "sender_id": self.my_id,
-                    "content": content
-                }
-
-                for n in neighbors:
-                    n.receive_message(msg)
+                self.send(MessageKind.ORIGIN_POSITIONS, content, measure_distance=False)
 
             return  
         
@@ -294,32 +321,20 @@ class Kilobot(Agent, RoutineR1, RoutineR2, RoutineR3):
             # Second phase: send the message to appropriate neighbors
             # If I am CORNER and I have count and I have not sent it yet, I send it to my neighbors
             if self.role == "CORNER" and self.count > 0 and not self.position:
-                for n in neighbors:
-                    n.receive_message({
-                        "sender_id": self.my_id,
-                        "content": content
-                    })
+                self.send(MessageKind.COUNT, content, measure_distance=False)
             
             # Otherwise, if I am BORDER and I have count and I have not sent it yet, I send it to my BORDER or CORNER neighbors
             if self.role == "BORDER" and self.count > 0:
                 
-                isCornerNeighbor = False
-                corner_id = -1
-                for robot in self.neighbor_roles:
-                    if robot['role'] == "CORNER":
-                        isCornerNeighbor = True
-                        corner_id = robot['id']
+                corner_id = self.corner_neighbor_id
+                isCornerNeighbor = corner_id != -1
                 
                 if isCornerNeighbor and self.position != [2,1] and not self.messageFromCorner:
                     content = {"corner_id": corner_id, "count": self.count, "C1": self.countMessage['C1'], "C2": self.countMessage['C2'], "C3": self.countMessage['C3']}
                 else:
                     content = {"count": self.count, "C1": self.countMessage['C1'], "C2": self.countMessage['C2'], "C3": self.countMessage['C3']}
     
-                for n in neighbors:
-                    n.receive_message({
-                        "sender_id": self.my_id,
-                        "content": content
-                    })
+                self.send(MessageKind.COUNT, content, measure_distance=False)
             
             return
     
@@ -328,11 +343,7 @@ class Kilobot(Agent, RoutineR1, RoutineR2, RoutineR3):
             # If a robot have countFullMessage, it sends it to its neighbors
             if not (self.countFullMessage is None):
                 content = self.countFullMessage
-                for n in neighbors:
-                    n.receive_message({
-                        "sender_id": self.my_id,
-                        "content": content
-                    })
+                self.send(MessageKind.FULL_COUNT, content, measure_distance=False)
             
             return
 
@@ -341,38 +352,67 @@ class Kilobot(Agent, RoutineR1, RoutineR2, RoutineR3):
             # If I have my position, send it
             if self.position:
                 content = self.position
+                kind = MessageKind.POSITION
             
             # If I don't have my position, but my auxPosition is set, send auxPosition
             if not self.position and (self.auxPosition[0] != -1 or self.auxPosition[1] != -1):
                 content = self.auxPosition             
+                kind = MessageKind.POSITION
 
 
         elif self.state == State.SET_ANIMATION_SINCRONIZATION or self.state == State.SET_ROLE_COLOR:
             return # No longer sending anything
         
-        for n in neighbors:
-            # Simulate distance calculation for SR1b
-            dist = self.calculate_distance(n)
-            
+        self.send(kind, content)
+
+
+    def send(self, kind, content, measure_distance=True):
+        """Broadcast 'content' (a message of the given kind) to every robot in IR range"""
+
+        # With the vectorized engine the message is only queued (packed as a frame), it is delivered in bulk after the step phase
+        if self.model.message_bus is not None:
+            self.model.message_bus.post(self, kind, content, measure_distance)
+            return
+
+        # Radius 3, Moore=True (includes diagonals)
+        # Simulate Kilobot's IR range, it can hear robots up to 3 units away, it can be increased if it's needed
+        # because we filter distances later. Robots don't move, so the neighbors come from the grid's static index
+        index = self.model.grid.neighbor_index
+        neighbors = index.neighbors_of(self)
+
+        # Simulate distance calculation for SR1b, all the pairs of this robot at once
+        start, stop = index.edges_of(self)
+        if measure_distance:
+            dists = self.model.ir_noise.measure(slice(start, stop)).tolist()
+
+        # Lost messages of this tick, from the link loss mask of every pair
+        lost = self.model.link_loss.lost(slice(start, stop)).tolist()
+
+        nbytes = frame_nbytes(kind, content)
+        content = _snapshot(content)  # The same copy for every receiver, as a decoded frame
+        for k, n in enumerate(neighbors):
+            if lost[k]:
+                continue
             msg = {
                 "sender_id": self.my_id,
-                "content": content,
-                "dist": dist
+                "kind": kind,
+                "content": content
             }
-            n.receive_message(msg)
+            if measure_distance:
+                msg["dist"] = dists[k]
+            n.receive_message(msg, nbytes)
 
 
     def calculate_distance(self, other_agent):
         """Calculate Euclidean distance to another agent to simulate IR distance measurement with error"""
 
-        dx = self.pos[0] - other_agent.pos[0]
-        dy = self.pos[1] - other_agent.pos[1]
-        dist = math.sqrt(dx*dx + dy*dy)
-        error = np.random.normal(0, self.model.ir_error)
-        dist_with_error = dist + error
-        return  dist_with_error
-
-    def receive_message(self, message):
-        if random.random() > self.model.lost_message_prob:
-            self.messages_sent_count += 1
-            self.inbox.append(message)
\ No newline at end of file
+        # The error of each pair and tick comes from the model's IR noise provider
+        index = self.model.grid.neighbor_index
+        edge = index.edge_between(self, other_agent)
+        if edge is None:
+            return None  # Out of IR range
+        return float(self.model.ir_noise.measure(edge))
+
+    def receive_message(self, message, nbytes):
+        self._swarm.count_message(self._row, nbytes)  # messages_sent_count and message_bytes_count
+        self.inbox.append(message)
\ No newline at end of file
@@ -0,0 +1,221 @@
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from checkpoint import snapshot, restore
+from messaging import MessageList
+from model import KilobotFormationModel, compute_accuracy
+
+# --- BENCHMARK SUITE ---
+# Simulator throughput, not protocol metrics (those are in Tests/):
+# - microbenchmarks of the hot Kilobot methods and reporters (microseconds per call)
+# - end-to-end runs with the sweep configuration (agent-steps per second and RSS growth)
+# The results are compared with BASELINE_FILE, measured on the reference machine.
+
+BASELINE_FILE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+TOLERANCE = 0.25     # Relative slowdown (or memory growth) reported as a regression
+REPEAT = 5           # Microbenchmarks keep the best of REPEAT rounds
+
+MICRO_SIDE = 30      # Swarm of the microbenchmarks
+SR1A_TICK = 30       # Tick (inside SR1a) of the microbenchmark state
+
+# End-to-end runs: (name, side_length, ticks). 100x100 only runs the start of SR1a, its most expensive phase
+END_TO_END = (
+    ("e2e_10x10", 10, 1350),
+    ("e2e_30x30", 30, 1350),
+    ("e2e_100x100", 100, 10),
+)
+SWEEP_PARAMS = {"delivery": "vectorized", "activation": "active", "fast_forward": True,
+                "stop_when": "phase:SET_ANIMATION_SINCRONIZATION", "collect_when": "final"}
+
+
+# --- Microbenchmarks ---
+# Every one returns (calls, seconds) of a round, setup excluded
+
+def _sr1a_checkpoint():
+    """Direct-delivery model in SR1a, every robot with the inbox of a tick"""
+
+    model = KilobotFormationModel(side_length=MICRO_SIDE, seed=1, collect_when="manual")
+    while model.schedule.steps < SR1A_TICK:
+        model.step()
+    for agent in model.kilobots:
+        agent.step()
+    return snapshot(model)
+
+
+def bench_broadcast_presence(checkpoint):
+    model = restore(checkpoint)
+    for agent in model.kilobots:
+        agent.inbox = MessageList()
+    start = time.perf_counter()
+    for agent in model.kilobots:
+        agent.broadcast_presence()
+    return len(model.kilobots), time.perf_counter() - start
+
+
+def bench_calculate_distance(checkpoint):
+    model = restore(checkpoint)
+    index = model.grid.neighbor_index
+    pairs = [(agent, other) for agent in model.kilobots for other in index.neighbors_of(agent)]
+    start = time.perf_counter()
+    for agent, other in pairs:
+        agent.calculate_distance(other)
+    return len(pairs), time.perf_counter() - start
+
+
+def bench_run_sr1a(checkpoint):
+    model = restore(checkpoint)
+    start = time.perf_counter()
+    for agent in model.kilobots:
+        agent.run_sr1a()
+    return len(model.kilobots), time.perf_counter() - start
+
+
+def bench_check_position(checkpoint):
+    model = restore(checkpoint)
+    agents = model.kilobots
+    neighborhoods = []
+    for agent in agents:
+        x, y = agent.pos
+        neighborhoods.append([[x + dx, y + dy] for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy])
+    start = time.perf_counter()
+    for agent, positions in zip(agents, neighborhoods):
+        agent.auxPosition = [-1, -1]
+        agent.check_position(positions)
+    return len(agents), time.perf_counter() - start
+
+
+def bench_compute_accuracy(checkpoint):
+    """compute_accuracy of a located swarm (every robot at its real position), without the per-tick cache"""
+
+    model = restore(checkpoint)
+    swarm = model.swarm
+    for row in range(swarm.size):
+        swarm.set_position(row, swarm.home[row].tolist())
+    calls = 20
+    start = time.perf_counter()
+    for _ in range(calls):
+        model._metrics_tick = None
+        compute_accuracy(model)
+    return calls, time.perf_counter() - start
+
+
+MICRO = (
+    ("broadcast_presence", bench_broadcast_presence),
+    ("calculate_distance", bench_calculate_distance),
+    ("run_sr1a", bench_run_sr1a),
+    ("check_position", bench_check_position),
+    ("compute_accuracy", bench_compute_accuracy),
+)
+
+
+def run_micro():
+    checkpoint = _sr1a_checkpoint()
+    results = {}
+    for name, bench in MICRO:
+        best = min(seconds / calls for calls, seconds in (bench(checkpoint) for _ in range(REPEAT)))
+        results[name] = {"value": 1e6 * best, "unit": "us/call", "better": "lower"}
+    return results
+
+
+# --- End-to-end runs (one fresh process each, for a clean peak RSS) ---
+
+def _peak_rss():
+    """Peak RSS of this process (MB). ru_maxrss survives exec, so in a spawned worker it
+    starts at the parent's peak: the high-water mark of /proc is used where there is one"""
+
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _end_to_end(side_length, ticks):
+    # The imports alone take ~90 MB, more than a small swarm: the memory of a run is
+    # its peak RSS over the peak after the imports (model construction included)
+    imported = _peak_rss()
+    model = KilobotFormationModel(side_length=side_length, seed=1, **SWEEP_PARAMS)
+    start = time.perf_counter()
+    while model.running and model.schedule.steps < ticks:
+        model.step()
+    seconds = time.perf_counter() - start
+    # Agent-steps of the ticks simulated, fast-forwarded ones included
+    agent_steps = model.swarm.size * model.schedule.steps
+    return agent_steps / seconds, _peak_rss() - imported
+
+
+def run_end_to_end(cases=END_TO_END):
+    results = {}
+    for name, side_length, ticks in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            throughput, rss_growth = pool.submit(_end_to_end, side_length, ticks).result()
+        results[f"{name}_throughput"] = {"value": throughput, "unit": "agent-steps/s", "better": "higher"}
+        results[f"{name}_rss_growth"] = {"value": rss_growth, "unit": "MB", "better": "lower"}
+    return results
+
+
+# --- Baseline ---
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """Names of the results worse than the baseline by more than 'tolerance' (relative)"""
+
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        ratio = result["value"] / reference["value"]
+        if result["better"] == "higher":
+            ratio = 1 / ratio if ratio else float("inf")
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kilobot simulator benchmarks")
+    parser.add_argument("--only", choices=("micro", "e2e"), help="run only one group of benchmarks")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.only != "e2e":
+        results.update(run_micro())
+    if args.only != "micro":
+        results.update(run_end_to_end())
+
+    baseline = {}
+    if BASELINE_FILE.exists():
+        baseline = json.loads(BASELINE_FILE.read_text())["results"]
+
+    print(f"{'benchmark':<28}{'value':>14}  {'unit':<14}{'baseline':>14}")
+    for name, result in results.items():
+        reference = baseline.get(name, {}).get("value")
+        reference = f"{reference:14.2f}" if reference is not None else f"{'-':>14}"
+        print(f"{name:<28}{result['value']:14.2f}  {result['unit']:<14}{reference}")
+
+    if args.update:
+        results = {**baseline, **results}
+        machine = {"python": platform.python_version(), "machine": platform.machine(), "processor": platform.processor()}
+        BASELINE_FILE.write_text(json.dumps({"machine": machine, "results": results}, indent=2) + "\n")
+        print(f"Baseline updated: {BASELINE_FILE.name}")
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name in regressions:
+        print(f"REGRESSION: {name} is more than {args.tolerance:.0%} worse than the baseline")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import hashlib
+import itertools
+import json
+import os
+from functools import lru_cache, partial
+from multiprocessing import Pool
+from pathlib import Path
+from tqdm.auto import tqdm
+
+PACKAGE_DIR = Path(__file__).resolve().parent
+CACHE_DIR = PACKAGE_DIR / ".cache" / "runs"
+
+# Modules that decide the results of a run: the code version hashes these and nothing else,
+# a new model module must be added here (tooling and scripts stay out of it)
+MODEL_SOURCES = ("agent.py", "model.py", "routines.py", "messaging.py", "swarm.py", "neighborhood.py",
+                 "channel.py", "codec.py", "rng.py", "scheduler.py", "stopping.py", "placement.py",
+                 "collection.py", "constant.py")
+
+
+@lru_cache(maxsize=None)
+def code_version():
+    """Hash of the model sources: editing any of them invalidates the cached runs"""
+
+    digest = hashlib.sha256()
+    for name in MODEL_SOURCES:
+        digest.update(name.encode())
+        digest.update((PACKAGE_DIR / name).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def _jsonable(value):
+    """JSON fallback: numpy scalars -> Python numbers, anything else -> its string"""
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+def _plain(value):
+    return value.item() if hasattr(value, "item") else value
+
+
+def cell_key(kwargs, max_steps, version=None):
+    """Content address of one run: its parameters (seed and iteration included), step limit and code version"""
+
+    content = json.dumps(
+        {"params": kwargs, "max_steps": max_steps, "code": version or code_version()},
+        sort_keys=True, default=_jsonable
+    )
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+class ResultCache:
+    """Final reporter values of finished runs, one JSON file per content address"""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = Path(directory)
+
+    def path(self, key):
+        return self.directory / key[:2] / f"{key}.json"
+
+    def get(self, key):
+        try:
+            with open(self.path(key)) as file:
+                return json.load(file)["results"]
+        except (FileNotFoundError, json.JSONDecodeError, KeyError):
+            return None
+
+    def put(self, key, kwargs, results):
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(temporary, "w") as file:
+            json.dump({"params": kwargs, "code": code_version(), "results": results}, file, default=_jsonable)
+        os.replace(temporary, path)  # Atomic: readers never see a half-written entry
+
+
+def expand_parameters(parameters):
+    """Every combination of the parameter values, as batch_run builds them (strings are single values)"""
+
+    values = []
+    for name, value in parameters.items():
+        if isinstance(value, str):
+            values.append([(name, value)])
+        else:
+            try:
+                values.append([(name, v) for v in value])
+            except TypeError:
+                values.append([(name, value)])
+    return [dict(combination) for combination in itertools.product(*values)]
+
+
+def run_cell(model_cls, max_steps, run):
+    """Run one model like batch_run and return the final reporter values of the run (run_id, kwargs)"""
+
+    run_id, kwargs = run
+    model = model_cls(**kwargs)
+    while model.running and model.schedule.steps <= max_steps:
+        model.step()
+    results = {name: _plain(values[-1]) for name, values in model.datacollector.model_vars.items()}
+    results["Step"] = model.schedule.steps - 1
+    return run_id, results
+
+
+def _run_all(process_func, runs, number_processes):
+    """Results of the runs as they finish, in this process or in a pool"""
+
+    if number_processes == 1:
+        yield from map(process_func, runs)
+    else:
+        with Pool(number_processes) as pool:
+            yield from pool.imap_unordered(process_func, runs)
+
+
+def iter_batch_run(model_cls, parameters, number_processes=1, max_steps=1000,
+                   display_progress=True, cache=None, skip=()):
+    """
+    batch_run with data_collection_period=-1 that only runs the cells missing from the cache.
+    Yields the row of every cell (the same as batch_run, plus its RunKey and Code version) as soon
+    as it is available: cached cells first, then the others as they finish.
+    Cells whose key is in 'skip' (already recorded somewhere) are left out.
+    Runs without a 'seed' are not reproducible, so they are never cached.
+    """
+
+    cache = cache or ResultCache()
+    version = code_version()
+    cells = expand_parameters(parameters)
+    keys = [cell_key(kwargs, max_steps, version) for kwargs in cells]
+
+    def row(run_id, results):
+        return {"RunId": run_id, "iteration": 0, **cells[run_id], **results, "RunKey": keys[run_id], "Code": version}
+
+    missing = []
+    found = 0
+    for run_id, kwargs in enumerate(cells):
+        if keys[run_id] in skip:
+            continue
+        results = cache.get(keys[run_id]) if kwargs.get("seed") is not None else None
+        if results is None:
+            missing.append((run_id, kwargs))
+        else:
+            found += 1
+            yield row(run_id, results)
+
+    if display_progress:
+        print(f"{len(cells) - len(missing) - found} runs already recorded, {found} found in the cache, {len(missing)} to run")
+
+    process_func = partial(run_cell, model_cls, max_steps)
+    with tqdm(total=len(missing), disable=not display_progress) as pbar:
+        for run_id, results in _run_all(process_func, missing, number_processes):
+            if cells[run_id].get("seed") is not None:
+                cache.put(keys[run_id], cells[run_id], results)
+            pbar.update()
+            yield row(run_id, results)
+
+
+def cached_batch_run(model_cls, parameters, number_processes=1, max_steps=1000,
+                     display_progress=True, cache=None):
+    """Rows of iter_batch_run in a list, sorted by RunId like batch_run returns them"""
+
+    rows = iter_batch_run(model_cls, parameters, number_processes, max_steps, display_progress, cache)
+    return sorted(rows, key=lambda row: row["RunId"])
@@ -0,0 +1,229 @@
+from functools import lru_cache
+import numpy as np
+from rng import seed_key, counter_uniforms, STREAM_IR_NOISE, STREAM_LOSS
+
+
+@lru_cache(maxsize=64)
+def _stream_key(rng_key, stream):
+    return seed_key(rng_key, stream)
+
+
+def _pair_codes(index):
+    """(sender row, receiver row) of every edge of a NeighborIndex as one integer"""
+    return (index.sources.astype(np.int64) << 32) | index.indices.astype(np.int64)
+
+
+def _pair_uniforms(model, stream, tick, edges, lane):
+    """Counter-based uniforms of the (sender, receiver) robot rows of 'edges' at 'tick'"""
+
+    index = model.grid.neighbor_index
+    return counter_uniforms(_stream_key(model.rng_key, stream), tick, index.sources[edges], index.indices[edges], lane)
+
+
+def _edge_ids(edges):
+    """Edge ids of an index array, a single edge or a slice of edges"""
+    return np.arange(edges.start, edges.stop) if isinstance(edges, slice) else edges
+
+
+class IRNoise:
+    """Gaussian IR ranging error of the directed pairs that send in a tick.
+
+    The error of a pair is a counter-based draw addressed by (run key, tick,
+    sender row, receiver row), so it only depends on (seed, tick, sender,
+    receiver): not on the order robots send in, on which other pairs are
+    drawn, nor on the edge ids of the grid's NeighborIndex (rebuilt when robots
+    move). The vectorized engine draws only the edges of the tick's senders;
+    the direct path, that asks sender by sender (or pair by pair, in
+    calculate_distance) and visits every pair anyway, gets the whole tick
+    drawn at once.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._drawn = None    # (tick, key, index) of _errors
+        self._errors = None   # Errors of every edge (direct path)
+
+    def errors(self, edges):
+        """Standard normal error of 'edges' (edge ids, a single edge or a slice of them) for the current tick"""
+
+        tick = self.model.schedule.steps
+        if isinstance(edges, (slice, int, np.integer)):
+            index = self.model.grid.neighbor_index
+            drawn = (tick, self.model.rng_key, index)
+            if self._drawn != drawn:
+                self._errors = self._draw(tick, slice(None))
+                self._drawn = drawn
+            return self._errors[edges]
+        return self._draw(tick, edges)
+
+    def _draw(self, tick, edges):
+        # Box-Muller on two independent uniforms of every pair
+        u1 = _pair_uniforms(self.model, STREAM_IR_NOISE, tick, edges, 0)
+        u2 = _pair_uniforms(self.model, STREAM_IR_NOISE, tick, edges, 1)
+        return np.sqrt(-2 * np.log1p(-u1)) * np.cos(2 * np.pi * u2)
+
+    def measure(self, edges):
+        """Measured distance (true distance + error) of the pairs 'edges'"""
+
+        index = self.model.grid.neighbor_index
+        return index.dist[edges] + self.model.ir_error * self.errors(edges)
+
+
+# --- LINK LOSS ---
+
+class LinkLoss:
+    """Lost messages of the directed pairs that send in a tick.
+
+    lost(edges) is a boolean mask over edge ids of the grid's NeighborIndex,
+    drawn from counter-based uniforms addressed by (run key, tick, sender row,
+    receiver row) like the IR noise: the direct and the vectorized delivery lose the same messages,
+    and a tick only draws the edges that send. Subclasses give the loss
+    probability of the edges for the tick.
+    """
+
+    # The loss of an edge only depends on the tick, not on the ticks it was drawn before
+    stateless = True
+
+    def __init__(self, model):
+        self.model = model
+        self._drawn = None   # (tick, key, index) of _lost
+        self._lost = None    # Mask of every edge (direct path, stateless models)
+
+    def probabilities(self, tick, edges):
+        """Loss probability of 'edges' at 'tick' (a scalar if it's the same for all)"""
+        return self.model.lost_message_prob
+
+    def lost(self, edges, tick=None):
+        """Mask of the messages of 'edges' (edge ids or a slice of them) lost this tick (or at 'tick')"""
+
+        tick = self.model.schedule.steps if tick is None else tick
+        if isinstance(edges, slice) and self.stateless:
+            index = self.model.grid.neighbor_index
+            drawn = (tick, self.model.rng_key, index)
+            if self._drawn != drawn:
+                self._lost = self._draw(tick, np.arange(len(index.dist)))
+                self._drawn = drawn
+            return self._lost[edges]
+        return self._draw(tick, _edge_ids(edges))
+
+    def _draw(self, tick, edges):
+        probabilities = self.probabilities(tick, edges)
+        if np.ndim(probabilities) == 0 and probabilities <= 0:
+            return np.zeros(np.shape(edges), dtype=bool)  # Lossless links, nothing to draw
+        return _pair_uniforms(self.model, STREAM_LOSS, tick, edges, 0) < probabilities
+
+    def kept_probability(self, edges):
+        """Probability that a message of each of 'edges' gets through now (fast-forwarded ticks)"""
+        return 1 - np.asarray(self.probabilities(self.model.schedule.steps, edges))
+
+
+class BernoulliLoss(LinkLoss):
+    """Independent loss of every message with probability lost_message_prob"""
+
+
+class GilbertElliottLoss(LinkLoss):
+    """Bursty links: every edge is a two-state (good/bad) Markov chain that moves once per tick.
+
+    Messages are lost with probability lost_message_prob in the good state and
+    'loss_bad' in the bad one. The state of an edge is only drawn when the edge
+    sends: after k ticks without sending it is drawn from the k-step transition
+    probabilities, so idle edges cost nothing.
+    """
+
+    stateless = False
+
+    def __init__(self, model, p_good_bad, p_bad_good, loss_bad=1.0):
+        super().__init__(model)
+        if p_good_bad + p_bad_good <= 0:
+            raise ValueError("Gilbert-Elliott links need p_good_bad + p_bad_good > 0")
+        self.p_good_bad = p_good_bad
+        self.p_bad_good = p_bad_good
+        self.loss_bad = loss_bad
+        self._index = None   # NeighborIndex of the edge ids of the states
+        self._bad = None     # State of every edge at the tick it was last drawn
+        self._since = None   # Tick of the state of every edge, -1 if never drawn
+
+    def probabilities(self, tick, edges):
+        index = self.model.grid.neighbor_index
+        if self._index is not index:
+            self._follow_pairs(index)
+
+        # Links start in the stationary distribution, then move k = tick - since steps
+        stationary = self.p_good_bad / (self.p_good_bad + self.p_bad_good)
+        since = self._since[edges]
+        decay = np.power(1 - self.p_good_bad - self.p_bad_good, tick - since)
+        p_bad = np.where(self._bad[edges], stationary + (1 - stationary) * decay, stationary * (1 - decay))
+        p_bad = np.where(since < 0, stationary, p_bad)
+        bad = _pair_uniforms(self.model, STREAM_LOSS, tick, edges, 1) < p_bad
+        self._bad[edges] = bad
+        self._since[edges] = tick
+        return np.where(bad, self.loss_bad, self.model.lost_message_prob)
+
+    def _follow_pairs(self, index):
+        """Move the states to the edge ids of a new index (rebuilt after robots moved), pair by pair"""
+
+        bad = np.zeros(len(index.dist), dtype=bool)
+        since = np.full(len(index.dist), -1, dtype=np.int64)
+        if self._index is not None and len(self._index.dist) and len(index.dist):
+            old, new = _pair_codes(self._index), _pair_codes(index)
+            order = np.argsort(old)
+            found = order[np.minimum(np.searchsorted(old, new, sorter=order), len(old) - 1)]
+            kept = old[found] == new
+            bad[kept] = self._bad[found[kept]]
+            since[kept] = self._since[found[kept]]
+        self._index, self._bad, self._since = index, bad, since
+
+
+class DistanceLoss(LinkLoss):
+    """Loss growing with the true distance of the pair: lost_message_prob + slope * (dist - 1), clipped to [0, 1]"""
+
+    def __init__(self, model, slope):
+        super().__init__(model)
+        self.slope = slope
+
+    def probabilities(self, tick, edges):
+        dist = self.model.grid.neighbor_index.dist[edges]
+        return np.clip(self.model.lost_message_prob + self.slope * (dist - 1), 0.0, 1.0)
+
+
+class DegradedReceivers(LinkLoss):
+    """A 'fraction' of the robots (chosen once) lose their incoming messages with probability 'loss'"""
+
+    def __init__(self, model, fraction, loss):
+        super().__init__(model)
+        self.fraction = fraction
+        self.loss = loss
+        self._degraded = None
+
+    def probabilities(self, tick, edges):
+        index = self.model.grid.neighbor_index
+        if self._degraded is None or len(self._degraded) != len(index):
+            chooser = np.random.Generator(np.random.Philox(key=seed_key(self.model.rng_key, STREAM_LOSS)))
+            self._degraded = chooser.random(len(index)) < self.fraction
+        return np.where(self._degraded[index.indices[edges]], self.loss, self.model.lost_message_prob)
+
+
+def make_link_loss(model, spec):
+    """
+    Link loss model of a 'loss_model' spec:
+    - "bernoulli"                 -> independent loss (lost_message_prob)
+    - "gilbert:P_GB,P_BG[,LOSS]"  -> bursty links, LOSS in the bad state (1 by default)
+    - "distance:SLOPE"            -> lost_message_prob + SLOPE * (dist - 1)
+    - "degraded:FRACTION,LOSS"    -> a fraction of the robots receive with loss LOSS
+    A LinkLoss subclass (or any callable taking the model) is used as it is.
+    """
+
+    if callable(spec):
+        return spec(model)
+
+    name, _, arg = spec.strip().partition(":")
+    args = [float(value) for value in arg.split(",")] if arg else []
+    if name == "bernoulli" and not args:
+        return BernoulliLoss(model)
+    if name == "gilbert" and len(args) in (2, 3):
+        return GilbertElliottLoss(model, *args)
+    if name == "distance" and len(args) == 1:
+        return DistanceLoss(model, *args)
+    if name == "degraded" and len(args) == 2:
+        return DegradedReceivers(model, *args)
+    raise ValueError(f"Unknown loss model {spec!r}")
@@ -0,0 +1,97 @@
+import pickle
+from collection import KilobotDataCollector
+from rng import fork_key, python_stream, numpy_stream
+from stopping import PhaseReached, parse_stop_conditions
+from constant import State
+
+# --- CHECKPOINTS ---
+# A checkpoint is the whole model pickled at the end of a tick: robots, swarm store,
+# inboxes, grid and neighbor index, scheduler, collector and the state of every
+# random stream. A restored model continues exactly like the original one would.
+# Callable stop conditions given to 'stop_when' must be picklable (module-level).
+
+# Parameters that can change in a fork. The others (size, delivery, activation, seed) shape the model
+FORKABLE = ("failure_prob", "ir_error", "lost_message_prob", "fast_forward", "stop_when", "collect_when", "iteration")
+
+
+def snapshot(model):
+    """Bytes of the complete state of the model"""
+    return pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def restore(data):
+    return pickle.loads(data)
+
+
+def save_checkpoint(model, path):
+    with open(path, "wb") as file:
+        pickle.dump(model, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_checkpoint(path):
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+def override(model, **params):
+    """
+    Change parameters of a (restored) model from the next tick on.
+    'iteration' gives the model new random streams, derived from its key, the
+    current tick and the iteration: replicas of the same checkpoint diverge.
+    Without it a fork keeps the streams of the original (common random numbers).
+    """
+
+    unknown = set(params) - set(FORKABLE)
+    if unknown:
+        raise ValueError(f"Parameters {sorted(unknown)} can't change in a fork (forkable: {FORKABLE})")
+
+    for name in ("failure_prob", "ir_error", "lost_message_prob", "fast_forward"):
+        if name in params:
+            setattr(model, name, params[name])
+    if "stop_when" in params:
+        model.stop_conditions = parse_stop_conditions(params["stop_when"])
+        model.running = True
+    if "collect_when" in params:
+        collector = model.datacollector
+        collector.collect_when, collector.period = KilobotDataCollector._parse(params["collect_when"])
+    if "iteration" in params:
+        model.iteration = params["iteration"]
+        model.rng_key = fork_key(model.rng_key, model.schedule.steps, params["iteration"])
+        model.random = python_stream(model.rng_key)
+        model.np_rng = numpy_stream(model.rng_key)
+    return model
+
+
+def fork(model, variants):
+    """
+    Independent copies of the model, one per dict of overridden parameters in 'variants'.
+    The model itself is not modified.
+    """
+
+    data = snapshot(model)
+    return [override(restore(data), **params) for params in variants]
+
+
+def run_to_phase(model, phase, max_steps=1000):
+    """Run the model until every working robot reaches the State 'phase' (its name or value)"""
+
+    reached = PhaseReached(getattr(State, phase) if isinstance(phase, str) else phase)
+    while model.running and model.schedule.steps <= max_steps and not reached(model):
+        model.step()
+    return model
+
+
+def run_variants(model, phase, variants, max_steps=1000):
+    """
+    Run the protocol once up to 'phase', then every variant from there (like batch_run).
+    Returns the final reporter values of every variant, with its overridden parameters.
+    """
+
+    run_to_phase(model, phase, max_steps)
+    rows = []
+    for params, variant in zip(variants, fork(model, variants)):
+        while variant.running and variant.schedule.steps <= max_steps:
+            variant.step()
+        results = {name: values[-1] for name, values in variant.datacollector.model_vars.items()}
+        rows.append({**params, **results, "Step": variant.schedule.steps - 1, "Fork_Step": model.schedule.steps})
+    return rows
@@ -0,0 +1,148 @@
+import struct
+import numpy as np
+from constant import MessageKind, ROLES
+
+# A frame is modelled on the kilobot message_t: 1 type byte + 9 data bytes (the CRC is not simulated)
+FRAME_SIZE = 10
+FRAME_DTYPE = np.dtype([("type", "u1"), ("data", "u1", (9,))])
+
+# SR1a neighbor lists don't fit in 9 bytes: they go to a side table of (id, randomNumber) entries
+# and the frame only carries their offset and length
+TABLE_ENTRY_SIZE = 2
+
+# Layout of every kind of frame (little endian, padded to FRAME_SIZE)
+_LAYOUTS = {
+    MessageKind.EMPTY: struct.Struct("<B9x"),
+    MessageKind.ID_BEACON: struct.Struct("<BBBIHx"),      # id, randomNumber, table offset, table length
+    MessageKind.NEIGHBOR_ID: struct.Struct("<BB8x"),      # id
+    MessageKind.NEIGHBOR_COUNT: struct.Struct("<BH7x"),   # count
+    MessageKind.ROLE: struct.Struct("<BBB7x"),            # id, role code
+    MessageKind.ORIGIN_NUMBER: struct.Struct("<BI5x"),    # number
+    MessageKind.ORIGIN_POSITIONS: struct.Struct("<BBBB6x"),  # ids of [2,1], [1,2] and [2,2]
+    MessageKind.COUNT: struct.Struct("<BHHHHB"),          # count, C1, C2, C3, corner_id (0 = none)
+    MessageKind.FULL_COUNT: struct.Struct("<BHHHHB"),     # same as COUNT, flagged as checked
+    MessageKind.POSITION: struct.Struct("<BBhh4x"),       # flags (bit 0: x known, bit 1: y known), x, y (signed)
+}
+
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+_ORIGIN_POSITIONS = ([2, 1], [1, 2], [2, 2])
+
+
+def frame_nbytes(kind, content):
+    """Bytes on the air of a message: its frame plus its side table entries"""
+
+    if kind == MessageKind.ID_BEACON:
+        return FRAME_SIZE + TABLE_ENTRY_SIZE * len(content["neighbors"])
+    return FRAME_SIZE
+
+
+class Frames:
+    """Frozen frames of one tick. The frames are decoded once, on first read,
+    and the decoded content is shared by all its receivers, as with dict payloads."""
+
+    def __init__(self, data, table):
+        self.data = data
+        self.table = table
+        self._contents = None
+
+    def __len__(self):
+        return len(self.data) // FRAME_SIZE
+
+    def as_array(self):
+        return np.frombuffer(self.data, dtype=FRAME_DTYPE)
+
+    def contents(self):
+        """Decoded content of every frame, by frame index"""
+
+        if self._contents is None:
+            self._contents = [self._decode(offset) for offset in range(0, len(self.data), FRAME_SIZE)]
+        return self._contents
+
+    def _decode(self, offset):
+        kind = self.data[offset]
+        fields = _LAYOUTS[kind].unpack_from(self.data, offset)
+
+        if kind == MessageKind.EMPTY:
+            return None
+        if kind == MessageKind.ID_BEACON:
+            _, sender_id, random_number, start, length = fields
+            entries = self.table[start * TABLE_ENTRY_SIZE:(start + length) * TABLE_ENTRY_SIZE]
+            neighbors = [{'id': entries[k], 'randomNumber': entries[k + 1]} for k in range(0, len(entries), TABLE_ENTRY_SIZE)]
+            rows = {entries[k]: k // TABLE_ENTRY_SIZE for k in range(0, len(entries), TABLE_ENTRY_SIZE)}  # ID -> row, not sent
+            return {"sender_id": sender_id, "randomNumber": random_number, "neighbors": neighbors, "rows": rows}
+        if kind in (MessageKind.NEIGHBOR_ID, MessageKind.NEIGHBOR_COUNT, MessageKind.ORIGIN_NUMBER):
+            return fields[1]
+        if kind == MessageKind.ROLE:
+            return {"id": fields[1], "role": ROLES[fields[2]]}
+        if kind == MessageKind.ORIGIN_POSITIONS:
+            return [{"id": id, "position": list(position)} for id, position in zip(fields[1:], _ORIGIN_POSITIONS)]
+        if kind == MessageKind.COUNT or kind == MessageKind.FULL_COUNT:
+            _, count, c1, c2, c3, corner_id = fields
+            content = {"count": count, "C1": c1, "C2": c2, "C3": c3}
+            if corner_id:
+                content["corner_id"] = corner_id
+            if kind == MessageKind.FULL_COUNT:
+                content["check"] = True
+            return content
+        if kind == MessageKind.POSITION:
+            _, known, x, y = fields
+            return [x if known & 1 else -1, y if known & 2 else -1]
+        raise ValueError(f"Unknown message kind {kind}")
+
+
+class Outbox:
+    """Preallocated buffer where the posts of a tick are packed as frames.
+
+    It is reused every tick; freeze() returns an immutable copy of the frames
+    packed so far for the receivers to read.
+    """
+
+    def __init__(self, capacity=64):
+        self._data = bytearray(capacity * FRAME_SIZE)
+        self._table = bytearray()
+        self.count = 0
+
+    def clear(self):
+        self.count = 0
+        del self._table[:]
+
+    def append(self, kind, content):
+        """Pack a message as the next frame and return its size in bytes"""
+
+        offset = self.count * FRAME_SIZE
+        if offset == len(self._data):
+            self._data.extend(bytes(len(self._data)))  # Double the capacity
+        self._pack(offset, kind, content)
+        self.count += 1
+        return frame_nbytes(kind, content)
+
+    def _pack(self, offset, kind, content):
+        layout = _LAYOUTS[kind]
+
+        if kind == MessageKind.EMPTY:
+            layout.pack_into(self._data, offset, kind)
+        elif kind == MessageKind.ID_BEACON:
+            neighbors = content["neighbors"]
+            start = len(self._table) // TABLE_ENTRY_SIZE
+            for neighbor in neighbors:
+                self._table.append(neighbor['id'])
+                self._table.append(neighbor['randomNumber'])
+            layout.pack_into(self._data, offset, kind, content["sender_id"], content["randomNumber"], start, len(neighbors))
+        elif kind in (MessageKind.NEIGHBOR_ID, MessageKind.NEIGHBOR_COUNT, MessageKind.ORIGIN_NUMBER):
+            layout.pack_into(self._data, offset, kind, content)
+        elif kind == MessageKind.ROLE:
+            layout.pack_into(self._data, offset, kind, content["id"], _ROLE_CODES[content["role"]])
+        elif kind == MessageKind.ORIGIN_POSITIONS:
+            layout.pack_into(self._data, offset, kind, *(entry["id"] for entry in content))
+        elif kind == MessageKind.COUNT or kind == MessageKind.FULL_COUNT:
+            layout.pack_into(self._data, offset, kind, content["count"], content["C1"], content["C2"], content["C3"],
+                             max(content.get("corner_id", 0), 0))
+        elif kind == MessageKind.POSITION:
+            # -1 is the protocol's "unknown" coordinate (auxPosition); any other value, 0 or negative too, is sent as is
+            x, y = content
+            layout.pack_into(self._data, offset, kind, (x != -1) | (y != -1) << 1, x, y)
+        else:
+            raise ValueError(f"Unknown message kind {kind}")
+
+    def freeze(self):
+        return Frames(bytes(self._data[:self.count * FRAME_SIZE]), bytes(self._table))
@@ -0,0 +1,126 @@
+import bisect
+import pandas as pd
+from mesa.datacollection import DataCollector
+from constant import PHASE_TIMERS
+
+
+class StepSeries:
+    """Recorded values of a model reporter, indexed by step (0-based tick, as batch_run reads them).
+
+    Only the steps chosen by the collection schedule are stored. Reading the
+    current step records it first, so final values are always available.
+    """
+
+    def __init__(self, collector):
+        self._collector = collector
+        self.steps = []
+        self.values = []
+
+    def __getitem__(self, step):
+        if step < 0:
+            step += self._collector.current_step() + 1
+        self._collector.ensure_recorded(step)
+        k = bisect.bisect_left(self.steps, step)
+        return self.values[k]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+
+class KilobotDataCollector(DataCollector):
+    """DataCollector that only evaluates the model reporters on the steps it records.
+
+    The model calls on_tick() after every tick and the schedule 'collect_when'
+    decides which steps are recorded:
+    - "every": every tick (the usual DataCollector)
+    - "every:N": steps 0, N, 2N... (batch_run's data_collection_period=N)
+    - "phases": the last tick of every phase (before each PHASE_TIMERS tick)
+    - "final": none while running
+    - "manual": only when collect() is called
+    The current step is also recorded when it is read, so with any schedule
+    the final values cost a single evaluation.
+    """
+
+    def __init__(self, model, model_reporters=None, collect_when="every"):
+        self.model = model
+        self.collect_when, self.period = self._parse(collect_when)
+        super().__init__(model_reporters=model_reporters)
+
+    @staticmethod
+    def _parse(collect_when):
+        name, _, arg = collect_when.partition(":")
+        if name == "every":
+            return name, int(arg) if arg else 1
+        if name in ("phases", "final", "manual") and not arg:
+            return name, None
+        raise ValueError(f"Unknown collection schedule {collect_when!r}")
+
+    def _new_model_reporter(self, name, reporter):
+        self.model_reporters[name] = reporter
+        self.model_vars[name] = StepSeries(self)
+
+    def current_step(self):
+        return self.model.schedule.steps - 1
+
+    def _due(self, step):
+        if self.collect_when == "every":
+            return step % self.period == 0
+        if self.collect_when == "phases":
+            return step + 2 in PHASE_TIMERS  # Tick step+1 is the last one before a timer
+        return False
+
+    def _record(self, steps):
+        """Evaluate the reporters once and store their values for 'steps'"""
+
+        for name, reporter in self.model_reporters.items():
+            if isinstance(reporter, str):
+                value = getattr(self.model, reporter, None)
+            elif isinstance(reporter, list):
+                value = reporter[0](*reporter[1])
+            else:
+                value = reporter(self.model)
+            series = self.model_vars[name]
+            series.steps.extend(steps)
+            series.values.extend([value] * len(steps))
+
+    def _recorded(self, step):
+        series = next(iter(self.model_vars.values()), None)
+        if series is None:
+            return True
+        k = bisect.bisect_left(series.steps, step)
+        return k < len(series.steps) and series.steps[k] == step
+
+    def ensure_recorded(self, step):
+        if self._recorded(step):
+            return
+        if step != self.current_step():
+            raise KeyError(f"Step {step} was not collected (collect_when={self.collect_when!r})")
+        self._record([step])
+
+    def on_tick(self, model, ticks=1):
+        """Record the last 'ticks' ticks run (more than one after a fast-forward) that the schedule asks for.
+        Skipped ticks report the state reached at the end of the jump."""
+
+        current = self.current_step()
+        due = [step for step in range(current - ticks + 1, current + 1) if self._due(step) and not self._recorded(step)]
+        if due:
+            self._record(due)
+
+    def collect(self, model):
+        """Record the current step on demand"""
+
+        step = self.current_step()
+        if step >= 0 and not self._recorded(step):
+            self._record([step])
+
+    def get_model_vars_dataframe(self):
+        if not self.model_reporters:
+            raise UserWarning(
+                "No model reporters have been defined in the DataCollector, returning empty DataFrame."
+            )
+        self.collect(self.model)
+        steps = next(iter(self.model_vars.values())).steps
+        return pd.DataFrame({name: series.values for name, series in self.model_vars.items()}, index=steps)
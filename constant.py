@@ -6,6 +6,28 @@ IR_ERROR = 0.02 # Error in IR 2%
 FAILURE_PROB = 0.0001 # Probability of kilobot failure 0.01%
 LOST_MESSAGE_PROB = 0.25 # Probability of lost message 20%
 SEPARATION = 1  # Separation between kilobots in grid cells
+DELIVERY = "direct" # Message delivery: "direct" (one receive_message per neighbor)
+                    # or "vectorized" (bulk delivery engine, see messaging.py)
+ACTIVATION = "full" # Agent activation: "full" (every robot every tick)
+                    # or "active" (only robots with work to do, see scheduler.py)
+FAST_FORWARD = False # Skip the ticks of a phase once the swarm can't change anything before its timer
+STOP_WHEN = None    # Early stop: None (run until max steps), "converged", "stable:K", "budget:SECONDS",
+                    # "phase:STATE_NAME[@MAX_STEPS]" or several of them comma-separated (see stopping.py)
+PLACEMENT = "grid"  # Robot placement: "grid" (one robot per MultiGrid cell) or "continuous" (real positions
+                    # with the packing, jitter and missing robots below, see placement.py)
+PACKING = "square"  # Lattice of the continuous placement: "square" or "hex"
+JITTER = 0.0        # Std of the gaussian position error of the continuous placement, in separations
+MISSING = 0.0       # Probability that a lattice site has no robot (continuous placement)
+LOSS_MODEL = "bernoulli" # Message loss: "bernoulli", "gilbert:P_GB,P_BG[,LOSS_BAD]", "distance:SLOPE"
+                         # or "degraded:FRACTION,LOSS" (see channel.make_link_loss)
+COLLECT_WHEN = "every" # Steps recorded by the DataCollector: "every", "every:N", "phases", "final" or "manual"
+                       # (see collection.py). The current step can always be read
+
+FAILURE_CHECK_PERIOD = 150  # Robots may fail when internal_clock % FAILURE_CHECK_PERIOD == FAILURE_CHECK_TICK
+FAILURE_CHECK_TICK = 100
+
+# internal_clock values at which Kilobot.advance changes the state (keep in sync with advance)
+PHASE_TIMERS = (1, 60, 140, 180, 260, 320, 370, 400, 970, 1070, 1270, 1300)
 
 R3_ANIMATION = "diagonal_wave" # Selected animation for routine 3
                   # Options: "diagonal_wave", "wasp", "smiley_face"
@@ -28,4 +50,30 @@ class State:
 
     # Routine R3
     SET_ANIMATION_SINCRONIZATION = 10
-    SET_ROLE_COLOR = 11
\ No newline at end of file
+    SET_ROLE_COLOR = 11
+
+
+# --- Robot's roles ---
+ROLES = ("UNDECIDED", "CORNER", "BORDER", "MIDDLE")  # Index = role code (packed messages, swarm store)
+
+# --- LED palette ---
+LED_COLORS = ("grey", "gray", "lightblue", "orange", "red", "green", "blue", "pink", "purple",
+              "black", "lightgreen", "brown", "yellow", "white")  # Index = LED code in the swarm store
+
+
+# --- Message kinds (type byte of a packed frame, see codec.py) ---
+class MessageKind:
+    EMPTY = 0             # Nothing to say (SR2c robot without position)
+
+    # Routine R1
+    ID_BEACON = 1         # SR1a: ID, randomNumber and neighbors heard so far
+    NEIGHBOR_ID = 2       # SR1b: ID
+    NEIGHBOR_COUNT = 3    # SR1c: number of neighbors
+    ROLE = 4              # SR1c: ID and role
+
+    # Routine R2
+    ORIGIN_NUMBER = 5     # SR2a: origin assignment number
+    ORIGIN_POSITIONS = 6  # SR2a: positions given by [1,1] to its neighbors
+    COUNT = 7             # SR2b: border count
+    FULL_COUNT = 8        # SR2b: final count message, flooded from [1,1]
+    POSITION = 9          # SR2c: position or auxPosition
@@ -0,0 +1,162 @@
+import argparse
+import sys
+import numpy as np
+from agent import Kilobot
+from messaging import MessageBus, Inbox
+from model import KilobotFormationModel
+
+# --- EQUIVALENCE CHECKS ---
+# Seeded runs of the fast paths against the reference ones:
+# - active-set and full activation, with both delivery engines: the same swarm
+#   columns and final reporters, bit for bit
+# - fast-forwarded and stepped quiescent ticks: the same, except the message
+#   counters of memoryless links (the skipped broadcasts are a binomial draw)
+# - vectorized and direct delivery: whole runs give the same swarm columns and
+#   final reporters, bit for bit; and at every tick of a direct run, a
+#   MessageBus fed with the same broadcasts delivers the same messages (sender,
+#   kind, content, measured distance), message counts and bytes to every robot.
+
+STEPS = 1350
+SEEDS = (1, 2, 3)
+
+# Channel and failure parameters of the checked runs
+CONFIGS = {
+    "ideal": {"ir_error": 0.0, "lost_message_prob": 0.0, "failure_prob": 0.0},
+    "default": {},
+    "noisy": {"ir_error": 0.05, "lost_message_prob": 0.3, "failure_prob": 0.001},
+    "gilbert": {"failure_prob": 0.001, "loss_model": "gilbert:0.05,0.3,0.9"},
+}
+
+# What fast-forward only counts: the swarm columns and reporters of the received messages
+COUNTERS = ("messages", "message_bytes", "Avg_Messages", "Avg_Message_Bytes")
+
+
+def run(steps=STEPS, **params):
+    """Model run like batch_run, final values only"""
+
+    model = KilobotFormationModel(collect_when="final", **params)
+    while model.running and model.schedule.steps <= steps:
+        model.step()
+    return model
+
+
+def differences(a, b, ignore=()):
+    """Names of the swarm columns and final reporters that differ between two models"""
+
+    names = []
+    for name in a.swarm._columns():
+        if name not in ignore and not np.array_equal(getattr(a.swarm, name)[:a.swarm.size],
+                                                     getattr(b.swarm, name)[:b.swarm.size]):
+            names.append(name)
+    metrics_a, metrics_b = a.metrics(), b.metrics()
+    names += [name for name in metrics_a if name not in ignore and metrics_a[name] != metrics_b[name]]
+    return names
+
+
+def check_schedulers(seed, side_length, delivery, params):
+    full = run(seed=seed, side_length=side_length, delivery=delivery, activation="full", **params)
+    active = run(seed=seed, side_length=side_length, delivery=delivery, activation="active", **params)
+    return differences(full, active)
+
+
+def check_engines(seed, side_length, params):
+    direct = run(seed=seed, side_length=side_length, delivery="direct", **params)
+    vectorized = run(seed=seed, side_length=side_length, delivery="vectorized", **params)
+    return differences(direct, vectorized)
+
+
+def check_fast_forward(seed, side_length, params):
+    stepped = run(seed=seed, side_length=side_length, delivery="vectorized", activation="active", **params)
+    skipped = run(seed=seed, side_length=side_length, delivery="vectorized", activation="active",
+                  fast_forward=True, **params)
+    # Links with a state are stepped through the skipped ticks, their counters match too
+    ignore = COUNTERS if stepped.link_loss.stateless else ()
+    return differences(stepped, skipped, ignore)
+
+
+def check_delivery(seed, side_length, params, steps=STEPS):
+    """
+    Direct run with a shadow MessageBus: every broadcast is also posted to the bus, and
+    before the first advance of a tick its fan-out is compared with the robots' inboxes.
+    Returns the mismatches as (tick, row, what), at most one per tick.
+    """
+
+    model = KilobotFormationModel(seed=seed, side_length=side_length, collect_when="final", **params)
+    swarm = model.swarm
+    shadow = [MessageBus(model)]
+    counted = [swarm.messages[:swarm.size].copy(), swarm.message_bytes[:swarm.size].copy()]
+    checked = [None]
+    mismatches = []
+    send, advance = Kilobot.send, Kilobot.advance
+
+    def send_both(agent, kind, content, measure_distance=True):
+        if agent.model is model:
+            shadow[0].post(agent, kind, content, measure_distance)
+        return send(agent, kind, content, measure_distance)
+
+    def compare():
+        tick = model.schedule.steps
+        delivery, indptr, counts, nbytes = shadow[0].fan_out()
+        shadow[0] = MessageBus(model)
+
+        # Counters of every receiver (broken ones included) during this step phase
+        messages, message_bytes = swarm.messages[:swarm.size].copy(), swarm.message_bytes[:swarm.size].copy()
+        if not np.array_equal(messages - counted[0], counts):
+            mismatches.append((tick, int(np.flatnonzero(messages - counted[0] != counts)[0]), "messages"))
+            return
+        if not np.array_equal(message_bytes - counted[1], nbytes):
+            mismatches.append((tick, int(np.flatnonzero(message_bytes - counted[1] != nbytes)[0]), "message_bytes"))
+            return
+        counted[:] = messages, message_bytes
+
+        # Messages of the working robots (a broken robot never clears its inbox), channel by channel
+        for row in np.flatnonzero(swarm.working()).tolist():
+            agent = model.kilobots[row]
+            direct = sorted(agent.inbox, key=lambda msg: msg["kind"])
+            if direct != list(Inbox(delivery, indptr[row], indptr[row + 1])):
+                mismatches.append((tick, row, "inbox"))
+                return
+
+    def advance_checked(agent):
+        if agent.model is model and checked[0] != model.schedule.steps:
+            checked[0] = model.schedule.steps
+            compare()
+        return advance(agent)
+
+    Kilobot.send, Kilobot.advance = send_both, advance_checked
+    try:
+        while model.running and model.schedule.steps <= steps:
+            model.step()
+    finally:
+        Kilobot.send, Kilobot.advance = send, advance
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Seeded equivalence checks of the simulator's fast paths")
+    parser.add_argument("--side", type=int, default=6, help="side_length of the checked swarms")
+    parser.add_argument("--seeds", default=",".join(map(str, SEEDS)), help="comma-separated seeds")
+    parser.add_argument("--configs", default=",".join(CONFIGS), help=f"comma-separated subset of {list(CONFIGS)}")
+    args = parser.parse_args(argv)
+
+    seeds = [int(seed) for seed in args.seeds.split(",")]
+    failed = 0
+    for name in args.configs.split(","):
+        params = CONFIGS[name]
+        for seed in seeds:
+            checks = {
+                "active == full (direct)": check_schedulers(seed, args.side, "direct", params),
+                "active == full (vectorized)": check_schedulers(seed, args.side, "vectorized", params),
+                "fast_forward == stepped": check_fast_forward(seed, args.side, params),
+                "vectorized == direct (run)": check_engines(seed, args.side, params),
+                "vectorized == direct delivery": check_delivery(seed, args.side, params),
+            }
+            for check, mismatches in checks.items():
+                status = "ok" if not mismatches else f"FAILED {mismatches[:3]}"
+                print(f"{name:<8} seed {seed:<4} {check:<30} {status}")
+                failed += bool(mismatches)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
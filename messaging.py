@@ -0,0 +1,257 @@
+import numpy as np
+from bisect import bisect_left, bisect_right
+from codec import Outbox
+
+_NO_MESSAGES = ()
+
+
+class MessageChannels:
+    """Typed channels over the messages a robot received in one tick.
+
+    channel(kind) gives the messages of one kind (see MessageKind), bucketed
+    on the first read, and neighbor_channel(kind, ids) their view restricted
+    to the robot's neighbors, cached by kind. The routines of an advance read
+    only the channel they need. The caches belong to the inbox of the tick
+    and go away with it.
+    """
+
+    __slots__ = ()
+
+    def neighbor_channel(self, kind, neighbor_ids):
+        """Messages of the given kind sent by a robot in 'neighbor_ids' (a set that doesn't change during the tick)"""
+
+        if self._neighbor_channels is None:
+            self._neighbor_channels = {}
+        view = self._neighbor_channels.get(kind)
+        if view is None:
+            view = [msg for msg in self.channel(kind) if msg["sender_id"] in neighbor_ids]
+            self._neighbor_channels[kind] = view
+        return view
+
+
+class MessageList(MessageChannels):
+    """Inbox filled message by message by the direct delivery path"""
+
+    __slots__ = ("_messages", "_channels", "_neighbor_channels")
+
+    def __init__(self):
+        self._messages = []
+        self._channels = None
+        self._neighbor_channels = None
+
+    def append(self, message):
+        self._messages.append(message)
+        self._channels = self._neighbor_channels = None
+
+    def channel(self, kind):
+        """Messages of the given kind, in arrival order"""
+
+        if self._channels is None:
+            messages = self._messages
+            kinds = {msg["kind"] for msg in messages}
+            if len(kinds) == 1:
+                # Usual case: every robot sends the same kind of message in a tick
+                self._channels = {kinds.pop(): messages}
+            else:
+                self._channels = {k: [msg for msg in messages if msg["kind"] == k] for k in kinds}
+        return self._channels.get(kind, _NO_MESSAGES)
+
+    def __iter__(self):
+        return iter(self._messages)
+
+    def __getitem__(self, index):
+        return self._messages[index]
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __bool__(self):
+        return bool(self._messages)
+
+
+class Inbox(MessageChannels):
+    """Read-only view over one receiver's slice of a tick's deliveries.
+
+    Routines read it exactly like the MessageList built by the direct
+    delivery path. The slice is sorted by kind, so every channel is a range
+    of it, and the dicts are only materialized for the channels read.
+    """
+
+    __slots__ = ("_delivery", "_start", "_stop", "_channels", "_neighbor_channels")
+
+    def __init__(self, delivery, start, stop):
+        self._delivery = delivery
+        self._start = start
+        self._stop = stop
+        self._channels = None
+        self._neighbor_channels = None
+
+    def channel(self, kind):
+        """Messages of the given kind, in arrival order"""
+
+        if self._channels is None:
+            self._channels = {}
+        view = self._channels.get(kind)
+        if view is None:
+            view = self._delivery.messages(*self._delivery.kind_range(self._start, self._stop, kind))
+            self._channels[kind] = view
+        return view
+
+    def __iter__(self):
+        return iter(self._delivery.messages(self._start, self._stop))
+
+    def __getitem__(self, index):
+        return self._delivery.messages(self._start, self._stop)[index]
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __bool__(self):
+        return self._stop > self._start
+
+
+class Delivery:
+    """Messages delivered in one tick, sorted by receiver (CSR layout) and by kind inside every receiver"""
+
+    def __init__(self, sender_ids, frames, post_index, dist, kinds):
+        self.sender_ids = sender_ids   # my_id of each post at sending time
+        self.frames = frames           # packed payload of each post
+        self.post_index = post_index   # post of each delivered message
+        self.dist = dist               # measured distance, NaN if not measured
+        self.kinds = kinds             # MessageKind of each delivered message (list)
+
+    def kind_range(self, start, stop, kind):
+        """Range of the messages of the given kind in the slice [start, stop)"""
+        return bisect_left(self.kinds, kind, start, stop), bisect_right(self.kinds, kind, start, stop)
+
+    def messages(self, start, stop):
+        """Build the message dicts of the slice [start, stop)"""
+
+        messages = []
+        contents = self.frames.contents()
+        posts = self.post_index[start:stop].tolist()
+        dists = self.dist[start:stop].tolist()
+        for post, kind, dist in zip(posts, self.kinds[start:stop], dists):
+            msg = {
+                "sender_id": self.sender_ids[post],
+                "kind": kind,
+                "content": contents[post]
+            }
+            if dist == dist:  # Not NaN -> the receiver measured the distance
+                msg["dist"] = dist
+            messages.append(msg)
+        return messages
+
+
+class MessageBus:
+    """Array-backed delivery engine for the broadcasts of a tick.
+
+    During the step phase every robot posts its payload once, packed as a
+    fixed-size frame in a reusable Outbox (see codec.py). deliver() then
+    fans all payloads out along the grid's NeighborIndex in bulk: message loss and
+    IR distance noise are drawn as whole arrays and each receiver gets an
+    Inbox over its CSR slice of (sender, payload, dist).
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.outbox = Outbox(len(model.kilobots))
+        self._clear_posts()
+
+    def _clear_posts(self):
+        self.senders = []
+        self.sender_ids = []
+        self.nbytes = []
+        self.measured = []
+        self.outbox.clear()
+
+    def post(self, agent, kind, content, measure_distance=True):
+        """Queue a broadcast of 'content' (a message of the given kind) from 'agent' for this tick"""
+
+        self.senders.append(self.model.grid.neighbor_index.row[agent.unique_id])
+        self.sender_ids.append(agent.my_id)
+        self.nbytes.append(self.outbox.append(kind, content))
+        self.measured.append(measure_distance)
+
+    def fan_out(self):
+        """
+        Delivery of the queued posts, without delivering it: (Delivery, indptr, counts, nbytes)
+        where the messages of row 'r' are indptr[r]:indptr[r + 1] and counts/nbytes are per row.
+        """
+
+        index = self.model.grid.neighbor_index
+        n_agents = len(index)
+
+        # Fan out: the edges of every post, straight from the neighbor index
+        senders = np.asarray(self.senders, dtype=np.int64)
+        starts = index.indptr[senders]
+        fan_out = index.indptr[senders + 1] - starts
+        post_index = np.repeat(np.arange(len(senders)), fan_out)
+        edges = np.arange(fan_out.sum()) - np.repeat(np.cumsum(fan_out) - fan_out, fan_out) + starts[post_index]
+
+        # Message loss of this tick, drawn only for the edges that send
+        kept = ~self.model.link_loss.lost(edges)
+        post_index = post_index[kept]
+        edges = edges[kept]
+        receivers = index.indices[edges]
+
+        # Distance measurement with IR noise, only where it is measured
+        measured = np.asarray(self.measured, dtype=bool)[post_index]
+        dist = np.full(len(edges), np.nan)
+        dist[measured] = self.model.ir_noise.measure(edges[measured])
+
+        # Sort by receiver and kind, keeping the posting order inside every channel of an inbox
+        frames = self.outbox.freeze()
+        kinds = frames.as_array()["type"][post_index]
+        order = np.lexsort((kinds, receivers))
+        delivery = Delivery(self.sender_ids, frames, post_index[order], dist[order], kinds[order].tolist())
+        counts = np.bincount(receivers, minlength=n_agents)
+        indptr = np.concatenate(([0], np.cumsum(counts))).tolist()
+        nbytes = np.bincount(receivers, weights=np.asarray(self.nbytes)[post_index], minlength=n_agents).astype(np.int64)
+        return delivery, indptr, counts, nbytes
+
+    def deliver(self):
+        """Deliver every queued post to the receivers' inboxes"""
+
+        delivery, indptr, counts, nbytes = self.fan_out()
+
+        # Message counters are updated on the swarm columns (same rows as the index)
+        self.model.swarm.count_messages(counts, nbytes)
+
+        index = self.model.grid.neighbor_index
+        for row in np.flatnonzero(counts).tolist():
+            index.agents[row].inbox = Inbox(delivery, indptr[row], indptr[row + 1])
+
+        self._clear_posts()
+
+
+def count_repeated_broadcasts(model, senders, ticks, nbytes):
+    """Count the messages that 'ticks' repeated broadcasts of the 'senders' (mask by row)
+    would deliver, without delivering them. The losses are drawn per receiver, or per pair
+    if the link loss model gives every pair its own probability. Links with a state
+    (Gilbert-Elliott) are stepped through every skipped tick, losing what stepping would."""
+
+    index = model.grid.neighbor_index
+    n_agents = len(index)
+    edges = np.flatnonzero(senders[index.sources])
+    if not model.link_loss.stateless:
+        # The loss of a tick depends on the previous ones: draw them in order
+        start = model.schedule.steps
+        kept = np.zeros(len(edges), dtype=np.int64)
+        for tick in range(start, start + ticks):
+            kept += ~model.link_loss.lost(edges, tick)
+        received = np.bincount(index.indices[edges], weights=kept, minlength=n_agents).astype(np.int64)
+        model.swarm.count_messages(received, received * nbytes)
+        return
+
+    kept = model.link_loss.kept_probability(edges)
+    if kept.ndim == 0:
+        # Same loss for every pair: one draw per receiver
+        heard = np.bincount(index.indices[edges], minlength=n_agents)
+        received = model.np_rng.binomial(heard * ticks, kept)
+    else:
+        # One draw per pair, with the loss of the pair at the start of the jump
+        received = np.bincount(index.indices[edges], weights=model.np_rng.binomial(ticks, kept),
+                               minlength=n_agents).astype(np.int64)
+
+    model.swarm.count_messages(received, received * nbytes)
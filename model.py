@@ -1,196 +1,282 @@
+import numpy as np
 from mesa import Model
-from mesa.time import SimultaneousActivation
-from mesa.space import MultiGrid
-from mesa.datacollection import DataCollector
+from mesa.time import SimultaneousActivation, StagedActivation
 from agent import Kilobot
-from constant import KILOBOTS_X, KILOBOTS_Y, SEPARATION, FAILURE_PROB, IR_ERROR, LOST_MESSAGE_PROB
+from messaging import MessageBus, count_repeated_broadcasts
+from channel import IRNoise, make_link_loss
+from neighborhood import KilobotGrid
+from swarm import SwarmState
+from scheduler import ActiveSetActivation, may_broadcast, quiescent, ticks_to_boundary
+from codec import FRAME_SIZE
+from rng import run_key, python_stream, numpy_stream, placement_stream
+from placement import place_robots, lattice_of, grid_cells
+from stopping import parse_stop_conditions
+from collection import KilobotDataCollector
+from constant import KILOBOTS_X, KILOBOTS_Y, SEPARATION, FAILURE_PROB, IR_ERROR, LOST_MESSAGE_PROB, DELIVERY, ACTIVATION, FAST_FORWARD, STOP_WHEN, COLLECT_WHEN, PLACEMENT, PACKING, JITTER, MISSING, LOSS_MODEL
 
 # --- AUXILIAR FUNCTIONS ---
 
-def compute_accuracy(model):
+# The 8 possible valid coordinate system formations (4 possible Corners * 2 Axis orientations per corner),
+# in the order they are tried. compute_metrics reports the index of the winner.
+HYPOTHESES = (
+    # --- GROUP A: ALIGNED AXES ---
+    "Origin Bottom-Left",      # 1. (x, y)
+    "Vertical Mirror",         # 2. (x, H - y + 1), origin Top-Left
+    "Horizontal Mirror",       # 3. (W - x + 1, y), origin Bottom-Right
+    "180 Rotation",            # 4. (W - x + 1, H - y + 1), origin Top-Right
+
+    # --- GROUP B: TRANSPOSED AXES (90 degree rotations) ---
+    "Transpose",               # 5. (y, x)
+    "90 Rotation",             # 6. (H - y + 1, x)
+    "-90 Rotation",            # 7. (y, W - x + 1)
+    "Inverse Transpose",       # 8. (H - y + 1, W - x + 1)
+)
+
+def compute_metrics(model):
     """
-    Calculates accuracy by checking the 8 possible valid coordinate system formations
-    (4 possible Corners * 2 Axis orientations per corner).
-    Returns the best accuracy found among the 8 hypotheses.
+    Calculates every reporter value in one pass over the swarm store, once per tick.
+    Accuracy checks the 8 coordinate hypotheses at once on (real, computed) coordinate
+    arrays and keeps the best one (the first one on ties). Error and message averages
+    come from the running totals of the swarm store.
     """
-    functional_agents = [a for a in model.schedule.agents if not a.isBroken]
-    
+    tick = model.schedule.steps
+    if model._metrics_tick == tick:
+        return model._metrics
+
+    swarm = model.swarm
+    index = model.grid.neighbor_index
+    working = swarm.working()
+    metrics = {
+        "Accuracy": 0.0,
+        "Accuracy_Hypothesis": -1,  # Index in HYPOTHESES, -1 if no robot fits any of them
+        "Avg_Error": swarm.error_total / swarm.located_count if swarm.located_count else 0.0,
+        "Avg_Messages": swarm.messages_total / swarm.working_count if swarm.working_count else 0.0,
+        "Avg_Message_Bytes": swarm.message_bytes_total / swarm.working_count if swarm.working_count else 0.0,
+    }
+
     # If all died or there are no agents, accuracy 0
-    if not functional_agents:
-        return 0.0
-
-    # Expected dimensions of the logical grid
-    W = model.num_kilobots_x
-    H = model.num_kilobots_y
-    
-    # We use the separation stored in the model
-    sep = model.model_separation
-
-    # Step 1: Collect data. 
-    # List of tuples: ( (Real_X, Real_Y), (Calc_X, Calc_Y) )
-    data = []
-    for agent in functional_agents:
-        # Convert physical position (float) to 1-based matrix index
-        # Use int(round()) to avoid floating point errors at edges
-        rx = int(agent.pos[0] / sep) + 1
-        ry = int(agent.pos[1] / sep) + 1
-        
-        # Position the agent believes it has
-        cx = agent.position[0] if agent.position else -1
-        cy = agent.position[1] if agent.position else -1
-        
-        data.append(((rx, ry), (cx, cy)))
-
-    # Step 2: Define the 8 transformations (Coordinate hypotheses)
-    # r[0] is real X, r[1] is real Y.
-    transforms = [
-        # --- GROUP A: ALIGNED AXES ---
-        lambda r: (r[0], r[1]),                     # 1. Origin Bottom-Left (Original)
-        lambda r: (r[0], H - r[1] + 1),             # 2. Vertical Mirror (Origin Top-Left)
-        lambda r: (W - r[0] + 1, r[1]),             # 3. Horizontal Mirror (Origin Bottom-Right)
-        lambda r: (W - r[0] + 1, H - r[1] + 1),     # 4. 180 Rotation (Origin Top-Right)
-        
-        # --- GROUP B: TRANSPOSED AXES (90 degree rotations) ---
-        lambda r: (r[1], r[0]),                     # 5. Transpose
-        lambda r: (H - r[1] + 1, r[0]),             # 6. 90 Rotation
-        lambda r: (r[1], W - r[0] + 1),             # 7. -90 Rotation
-        lambda r: (H - r[1] + 1, W - r[0] + 1)      # 8. Inverse Transpose
-    ]
-
-    max_accuracy = 0.0
-
-    # Step 3: Test all and keep the best one
-    for t in transforms:
-        correct_count = 0
-        for real_pos, calc_pos in data:
-            # Calculate where the robot SHOULD be according to this hypothesis
-            expected = t(real_pos)
-            
-            # Compare with where it believes it is
-            if expected[0] == calc_pos[0] and expected[1] == calc_pos[1]:
-                correct_count += 1
-        
-        current_acc = correct_count / len(functional_agents)
-        
-        if current_acc > max_accuracy:
-            max_accuracy = current_acc
-            
-        # Optimization: If we find 100%, stop
-        if max_accuracy == 1.0:
-            break
+    # (robots removed from the grid are not part of the formation)
+    working &= index.placed
+    if working.any():
+        # Expected dimensions of the logical grid
+        W = model.num_kilobots_x
+        H = model.num_kilobots_y
+
+        # Real 1-based matrix position and the position each robot believes it has ([-1,-1] if none)
+        rx, ry = index.lattice[working].T
+        calc = np.where(swarm.has_position[:swarm.size, None], swarm.position[:swarm.size], -1)[working]
+        cx, cy = calc.T
 
-    return max_accuracy
+        # Where every robot SHOULD be according to each hypothesis (rows in HYPOTHESES order)
+        expected_x = np.stack([rx, rx, W - rx + 1, W - rx + 1, ry, H - ry + 1, ry, H - ry + 1])
+        expected_y = np.stack([ry, H - ry + 1, ry, H - ry + 1, rx, rx, W - rx + 1, W - rx + 1])
+        correct = ((expected_x == cx) & (expected_y == cy)).sum(axis=1)
 
+        best = int(np.argmax(correct))
+        if correct[best] > 0:
+            metrics["Accuracy"] = int(correct[best]) / len(cx)
+            metrics["Accuracy_Hypothesis"] = best
+
+    model._metrics_tick = tick
+    model._metrics = metrics
+    return metrics
+
+
+def compute_accuracy(model):
+    """
+    Best accuracy found among the 8 coordinate hypotheses (see compute_metrics).
+    """
+    return compute_metrics(model)["Accuracy"]
+
+def compute_accuracy_hypothesis(model):
+    """
+    Index in HYPOTHESES of the hypothesis that gives the accuracy.
+    """
+    return compute_metrics(model)["Accuracy_Hypothesis"]
 
 def compute_avg_error(model):
     """
     Calculates the average error (Manhattan Distance) of the robots.
     """
-    total_error = 0
-    count = 0
-    sep = model.model_separation
-    
-    for agent in model.schedule.agents:
-        if agent.isBroken: continue
-        if not agent.position or agent.position == [-1, -1]: continue
-
-        real_grid_x = int(agent.pos[0] / sep) + 1
-        real_grid_y = int(agent.pos[1] / sep) + 1
-        
-        calc_x = agent.position[0]
-        calc_y = agent.position[1]
-        
-        dist = abs(real_grid_x - calc_x) + abs(real_grid_y - calc_y)
-        total_error += dist
-        count += 1
-        
-    return total_error / count if count > 0 else 0.0
+    return compute_metrics(model)["Avg_Error"]
+
+def compute_convergence_time(model):
+    """
+    Step at which every working robot had a valid position (-1 if not yet).
+    """
+    return model.convergence_step
 
 def compute_avg_messages(model):
     """
     Calculates the average messages sent per robot.
     """
-    total_msgs = 0
-    count = 0
-    for agent in model.schedule.agents:
-        if not agent.isBroken:
-            total_msgs += getattr(agent, 'messages_sent_count', 0)
-            count += 1
-    return total_msgs / count if count > 0 else 0.0
+    return compute_metrics(model)["Avg_Messages"]
 
+def compute_avg_message_bytes(model):
+    """
+    Calculates the average bytes of the messages counted by compute_avg_messages.
+    """
+    return compute_metrics(model)["Avg_Message_Bytes"]
 
 # --- MODEL CLASS ---
 
 class KilobotFormationModel(Model):
 
-    def __init__(self, side_length=10, 
+    def __init__(self, side_length=None, 
                  failure_prob=FAILURE_PROB, ir_error=IR_ERROR,
-                 lost_message_prob=LOST_MESSAGE_PROB):
+                 lost_message_prob=LOST_MESSAGE_PROB, delivery=DELIVERY,
+                 activation=ACTIVATION, fast_forward=FAST_FORWARD,
+                 stop_when=STOP_WHEN, collect_when=COLLECT_WHEN,
+                 width=None, height=None, placement=PLACEMENT, packing=PACKING,
+                 jitter=JITTER, missing=MISSING, loss_model=LOSS_MODEL, iteration=0, seed=None):
         
         super().__init__()
-        
-        # Configure square dimensions
-        """self.num_kilobots_x = side_length
-        self.num_kilobots_y = side_length"""
 
-        self.num_kilobots_x = KILOBOTS_X
-        self.num_kilobots_y = KILOBOTS_Y
+        # Random streams of this run, derived from (seed, iteration): the same run gives the same
+        # results in any process, and runs with the same key share their random numbers
+        self.iteration = iteration
+        self.rng_key = run_key(self._seed, iteration)
+        self.random = python_stream(self.rng_key)   # Agents and routines (through Agent.random)
+        self.np_rng = numpy_stream(self.rng_key)    # Bulk draws (vectorized delivery)
+        
+        # Configure dimensions: width x height robots, side_length x side_length if only
+        # the side is given, KILOBOTS_X x KILOBOTS_Y by default
+        self.num_kilobots_x = width or side_length or KILOBOTS_X
+        self.num_kilobots_y = height or side_length or KILOBOTS_Y
         
         # Store parameters
         self.failure_prob = failure_prob
         self.ir_error = ir_error
         self.lost_message_prob = lost_message_prob
+        self.fast_forward = fast_forward
+        self.stop_conditions = parse_stop_conditions(stop_when)
         self.model_separation = SEPARATION 
         
         # Physical Grid dimensions
         self.grid_w = self.num_kilobots_x * SEPARATION
         self.grid_h = self.num_kilobots_y * SEPARATION
         
-        self.grid = MultiGrid(self.grid_w, self.grid_h, torus=False)
-        self.schedule = SimultaneousActivation(self)
+        if activation == "active":
+            # Only robots with pending messages, due timers or broadcasts are activated (delivers by itself)
+            self.schedule = ActiveSetActivation(self)
+        elif delivery == "vectorized":
+            # Messages posted in the step phase are delivered in bulk before the advance phase
+            self.schedule = StagedActivation(self, ["step", "model.deliver_messages", "advance"])
+        else:
+            self.schedule = SimultaneousActivation(self)
         self.running = True
         self.convergence_step = -1
+        self._metrics_tick = None   # Tick of the cached reporter values (see compute_metrics)
+        self._metrics = None
         
+        # Continuous placement: real positions around the lattice sites (see placement.py),
+        # the robots are drawn on the nearest grid cell
+        self.placement = placement
+        if placement == "continuous":
+            positions = place_robots(self.num_kilobots_x, self.num_kilobots_y, SEPARATION, packing,
+                                     jitter, missing, placement_stream(self.rng_key))
+            n_robots = len(positions)
+        elif placement == "grid":
+            if packing != "square" or jitter or missing:
+                raise ValueError("packing, jitter and missing need placement='continuous'")
+            n_robots = self.num_kilobots_x * self.num_kilobots_y
+        else:
+            raise ValueError(f"Unknown placement {placement!r}")
+
         # Agent creation
-        count = 0
-        for i in range(self.num_kilobots_x):
-            for j in range(self.num_kilobots_y):
-                a = Kilobot(count, self)
-                self.schedule.add(a)
-                x = i * SEPARATION
-                y = j * SEPARATION
-                if x < self.grid_w and y < self.grid_h:
-                    self.grid.place_agent(a, (x, y))
-                count += 1
+        # A robot has the same row in the swarm store and in the grid's neighbor index
+        # (the grid keeps the home lattice positions of the swarm store up to date)
+        # On the grid, the robot 'count' sits at the lattice cell (i, j) = divmod(count, num_kilobots_y)
+        self.swarm = SwarmState(n_robots)
+        self.grid = KilobotGrid(self.grid_w, self.grid_h, SEPARATION, self.swarm)
+        self.kilobots = [Kilobot(count, self) for count in range(n_robots)]  # Agents indexed by unique_id
+        self.message_bus = None
+        for a in self.kilobots:
+            self.schedule.add(a)
+        if placement == "continuous":
+            # Real positions are mapped back to their nearest lattice site to check the computed ones
+            self.grid.place_agents(self.kilobots, grid_cells(positions, self.grid_w, self.grid_h),
+                                   positions, lattice_of(positions, SEPARATION, packing))
+        else:
+            i, j = np.divmod(np.arange(n_robots), self.num_kilobots_y)
+            self.grid.place_agents(self.kilobots, np.column_stack((i * SEPARATION, j * SEPARATION)))
+
+        # IR ranging errors, drawn in bulk per tick from a counter-based generator keyed by the seed
+        self.ir_noise = IRNoise(self)
+
+        # Lost messages, drawn in bulk per tick as a mask over every pair (both delivery engines)
+        self.link_loss = make_link_loss(self, loss_model)
+
+        if delivery == "vectorized":
+            self.message_bus = MessageBus(self)
         
-        # DataCollector
-        self.datacollector = DataCollector(
+        # DataCollector, reporters are only evaluated on the steps recorded by 'collect_when'
+        self.datacollector = KilobotDataCollector(
+            self,
             model_reporters={
                 "Accuracy": compute_accuracy,          
+                "Accuracy_Hypothesis": compute_accuracy_hypothesis,
                 "Avg_Error": compute_avg_error,        
-                "Convergence_Time": lambda m: m.convergence_step,
-                "Avg_Messages": compute_avg_messages
-            }
+                "Convergence_Time": compute_convergence_time,
+                "Avg_Messages": compute_avg_messages,
+                "Avg_Message_Bytes": compute_avg_message_bytes
+            },
+            collect_when=collect_when
         )
 
+    def metrics(self):
+        """Reporter values of the current tick (see compute_metrics)"""
+        return compute_metrics(self)
+
+    def convergence_ticks(self):
+        """Tick at which every working robot got its current valid position (-1 if it has none)"""
+        swarm = self.swarm
+        return swarm.converged_at[:swarm.size][swarm.working()]
+
+    def deliver_messages(self):
+        """Stage between step and advance used by the vectorized delivery engine"""
+        self.message_bus.deliver()
+
+    def skip_quiescent_ticks(self):
+        """
+        Jumps to the next phase boundary if no robot can change anything before it.
+        The robots' broadcasts of the skipped ticks are only counted.
+        Returns the number of skipped ticks.
+        """
+        if not quiescent(self):
+            return 0
+
+        swarm = self.swarm
+        working = swarm.working()
+        clock = swarm.clock[:swarm.size]
+        ticks = ticks_to_boundary(int(clock[working][0]))
+        if ticks == 0:
+            return 0
+
+        # No ID beacons in the fast-forward phases, every message is a single frame
+        count_repeated_broadcasts(self, working & may_broadcast(swarm), ticks, FRAME_SIZE)
+        clock[working] += ticks
+        self.schedule.steps += ticks
+        self.schedule.time += ticks
+        return ticks
+
     def step(self):
         self.schedule.step()
         
         # --- Convergence detection logic ---
-        if self.convergence_step == -1:
-            total_agents = 0
-            ready_agents = 0
-            
-            for agent in self.schedule.agents:
-                if not agent.isBroken:
-                    total_agents += 1
-                    # Considered ready if it has a valid position
-                    if agent.position and agent.position != [-1, -1]:
-                        ready_agents += 1
-            
-            # If all living agents have a position
-            if total_agents > 0 and ready_agents == total_agents:
-                self.convergence_step = self.schedule.steps
-
-        # Collect data passing the model as an argument
-        self.datacollector.collect(self)
\ No newline at end of file
+        # If all living agents have a valid position (counters kept by the swarm store)
+        if self.convergence_step == -1 and self.swarm.converged():
+            self.convergence_step = self.schedule.steps
+
+        # Collect data if the collection schedule records this tick
+        self.datacollector.on_tick(self)
+
+        # --- Fast-forward over quiescent ticks ---
+        if self.fast_forward:
+            skipped = self.skip_quiescent_ticks()
+            if skipped:
+                self.datacollector.on_tick(self, skipped)
+
+        # --- Early stop ---
+        if any(condition(self) for condition in self.stop_conditions):
+            self.running = False
\ No newline at end of file
@@ -0,0 +1,234 @@
+import numpy as np
+from mesa.space import MultiGrid
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # Optional: neighbor_pairs falls back to a cell-bucket join
+    cKDTree = None
+
+
+def _expand(starts, counts):
+    """Concatenated ranges [starts[k], starts[k] + counts[k]) and the k of every element"""
+
+    owner = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return starts[owner] + offsets, owner
+
+
+def neighbor_pairs(positions, radius):
+    """
+    Directed pairs (source, neighbor) of real positions at Chebyshev distance <= radius
+    (the Moore neighbourhood of the grid, in continuous space), sorted by source and then by
+    the neighbor's (x, y) like MultiGrid.get_neighbors. Uses a KD-tree if scipy is installed,
+    otherwise a join of radius-sized buckets; both are near-linear in the number of robots.
+    """
+
+    if cKDTree is not None:
+        pairs = cKDTree(positions).query_pairs(radius, p=np.inf, output_type="ndarray")
+        sources = np.concatenate((pairs[:, 0], pairs[:, 1]))
+        targets = np.concatenate((pairs[:, 1], pairs[:, 0]))
+    else:
+        # Every robot against the robots of the 3x3 buckets around its own
+        buckets = np.floor((positions - positions.min(axis=0)) / radius).astype(np.int64)
+        rows = buckets[:, 1].max() + 3
+        keys = (buckets[:, 0] + 1) * rows + buckets[:, 1] + 1
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        sources, targets = [], []
+        for ox in (-1, 0, 1):
+            for oy in (-1, 0, 1):
+                other = keys + ox * rows + oy
+                starts = np.searchsorted(sorted_keys, other, side="left")
+                counts = np.searchsorted(sorted_keys, other, side="right") - starts
+                candidates, owner = _expand(starts, counts)
+                found = order[candidates]
+                near = (np.abs(positions[owner] - positions[found]).max(axis=1) <= radius) & (owner != found)
+                sources.append(owner[near])
+                targets.append(found[near])
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+
+    order = np.lexsort((positions[targets, 1], positions[targets, 0], sources))
+    return sources[order].astype(np.int32), targets[order].astype(np.int32)
+
+
+class NeighborIndex:
+    """Radius-r Moore neighbourhood of every robot, stored as flat arrays.
+
+    Row i describes the robot of swarm row i (agents[i]): its neighbours are
+    indices[indptr[i]:indptr[i+1]] (in the same order as MultiGrid.get_neighbors
+    returns them) and dist holds the true Euclidean distance of each of those
+    pairs. The position of a pair in the flat arrays is its edge id. Rows of
+    robots that are not on the grid ('placed' False) have no pairs.
+
+    'positions' are the real positions of the robots and 'lattice' the 1-based
+    lattice coordinates they map back to. Robots placed in continuous space get
+    their pairs from neighbor_pairs instead of the dense cell lookup.
+    """
+
+    def __init__(self, agents, positions, lattice, placed, width, height, radius=3, continuous=False):
+        for row, agent in enumerate(agents):
+            if agent is not None and agent._row != row:
+                raise ValueError(f"Agent {agent.unique_id} has swarm row {agent._row}, not index row {row}")
+        self.agents = agents
+        self.row = {a.unique_id: i for i, a in enumerate(agents) if a is not None}
+        self.radius = radius
+        self.positions = np.asarray(positions, dtype=float)
+        self.lattice = np.asarray(lattice)
+        self.placed = np.asarray(placed, dtype=bool)
+        rows = np.flatnonzero(self.placed).astype(np.int32)
+
+        if continuous:
+            sources, targets = neighbor_pairs(self.positions[rows], radius)
+            self.sources, self.indices = rows[sources], rows[targets]
+            self.indptr = np.concatenate(([0], np.cumsum(np.bincount(self.sources, minlength=len(agents)))))
+            self._set_distances()
+            return
+
+        cells = self.positions[rows].astype(np.int64).reshape(-1, 2)
+
+        # One robot per cell: dense lookup cell -> row
+        # (rows and edges are stored as int32 to keep big swarms within memory, ~20 bytes per edge)
+        occupant = np.full((width, height), -1, dtype=np.int32)
+        occupant[cells[:, 0], cells[:, 1]] = rows
+
+        # Visit the offsets in the same order as mesa (x first, then y)
+        offsets = [(dx, dy) for dx in range(-radius, radius + 1)
+                   for dy in range(-radius, radius + 1) if (dx, dy) != (0, 0)]
+        neighbors = np.full((len(rows), len(offsets)), -1, dtype=np.int32)
+        for k, (dx, dy) in enumerate(offsets):
+            x = cells[:, 0] + dx
+            y = cells[:, 1] + dy
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            neighbors[inside, k] = occupant[x[inside], y[inside]]
+
+        present = neighbors >= 0
+        degree = np.zeros(len(agents), dtype=np.int64)
+        degree[rows] = present.sum(axis=1)
+        self.indptr = np.concatenate(([0], np.cumsum(degree)))
+        self.indices = neighbors[present]
+        del neighbors, present
+        self.sources = np.repeat(np.arange(len(agents), dtype=np.int32), degree)
+        self._set_distances()
+
+    def _set_distances(self):
+        dx = self.positions[self.sources, 0] - self.positions[self.indices, 0]
+        dy = self.positions[self.sources, 1] - self.positions[self.indices, 1]
+        self.dist = np.sqrt(dx * dx + dy * dy)
+
+    def __len__(self):
+        return len(self.agents)
+
+    def edges_of(self, agent):
+        """Edge ids [start, stop) of the pairs sent by 'agent'"""
+
+        i = self.row[agent.unique_id]
+        return self.indptr[i], self.indptr[i + 1]
+
+    def neighbors_of(self, agent):
+        """Neighbor agents of 'agent', in edge order"""
+
+        start, stop = self.edges_of(agent)
+        agents = self.agents
+        return [agents[j] for j in self.indices[start:stop].tolist()]
+
+    def edge_between(self, agent, other):
+        """Edge id of the pair (agent -> other), None if 'other' is out of range"""
+
+        start, stop = self.edges_of(agent)
+        hits = np.flatnonzero(self.indices[start:stop] == self.row[other.unique_id])
+        return start + int(hits[0]) if len(hits) else None
+
+
+class KilobotGrid(MultiGrid):
+    """MultiGrid that keeps a static NeighborIndex of the robots placed on it.
+
+    Robots never move, so the index is built once, on first use, and only
+    invalidated if an agent is placed, moved or removed. The index rows are
+    the robots' swarm rows (agent._row), whatever the placement order. The
+    'swarm' store, if given, gets the lattice position of every placed robot
+    as its home (see SwarmState.set_home).
+    """
+
+    def __init__(self, width, height, separation=1, swarm=None):
+        super().__init__(width, height, torus=False)
+        self.separation = separation
+        self.swarm = swarm
+        self._agents = []   # Agents that have been placed, by swarm row (None if never placed)
+        self._placed = np.zeros(0, dtype=bool)       # On the grid now, by row
+        self._positions = np.zeros((0, 2))           # Real position of every row
+        self._lattice = np.zeros((0, 2), dtype=np.int64)  # 1-based lattice coordinates of every row
+        self._continuous = False
+        self._neighbor_index = None
+
+    @property
+    def neighbor_index(self):
+        if self._neighbor_index is None:
+            n_rows = self.swarm.size if self.swarm is not None else len(self._agents)
+            if len(self._agents) > n_rows:
+                raise RuntimeError(f"{len(self._agents)} rows on the grid but {n_rows} in the swarm store")
+            self._reserve(n_rows)
+            self._neighbor_index = NeighborIndex(
+                self._agents, self._positions, self._lattice, self._placed, self.width, self.height,
+                continuous=self._continuous
+            )
+        return self._neighbor_index
+
+    def _invalidate_neighbor_index(self):
+        self._neighbor_index = None
+
+    def _reserve(self, n_rows):
+        """Grow the per-row arrays to 'n_rows' rows"""
+
+        missing = n_rows - len(self._agents)
+        if missing > 0:
+            self._agents.extend([None] * missing)
+            self._placed = np.concatenate((self._placed, np.zeros(missing, dtype=bool)))
+            self._positions = np.concatenate((self._positions, np.full((missing, 2), np.nan)))
+            self._lattice = np.concatenate((self._lattice, np.zeros((missing, 2), dtype=np.int64)))
+
+    def _set_sites(self, agents, positions, lattice):
+        """Record the real positions and lattice coordinates of the rows of 'agents'"""
+
+        rows = np.array([agent._row for agent in agents], dtype=np.int64)
+        if len(rows):
+            self._reserve(int(rows.max()) + 1)
+        for agent, row in zip(agents, rows.tolist()):
+            self._agents[row] = agent
+        self._placed[rows] = True
+        self._positions[rows] = positions
+        self._lattice[rows] = lattice
+        if self.swarm is not None:
+            self.swarm.set_home(self._lattice[rows], rows)
+        self._invalidate_neighbor_index()
+
+    def place_agent(self, agent, pos):
+        """Place (or move) one agent, its real position is the cell"""
+
+        super().place_agent(agent, pos)
+        cell = np.array([pos], dtype=np.int64)
+        self._set_sites([agent], cell, cell // self.separation + 1)
+
+    def place_agents(self, agents, cells, positions=None, lattice=None):
+        """
+        Place many agents at once ('cells' is an (n, 2) array), the index is invalidated once.
+        Robots in continuous space also give their real 'positions' (the cells are only
+        used to draw them) and 'lattice' coordinates, for every robot on the grid.
+        """
+
+        grid = self._grid
+        for agent, (x, y) in zip(agents, cells.tolist()):
+            grid[x][y].append(agent)
+            agent.pos = (x, y)
+        if self._empties_built:
+            self._empties.difference_update(map(tuple, cells.tolist()))
+        if positions is None:
+            self._set_sites(agents, cells, cells // self.separation + 1)
+        else:
+            self._continuous = True
+            self._set_sites(agents, positions, lattice)
+
+    def remove_agent(self, agent):
+        super().remove_agent(agent)
+        self._placed[agent._row] = False
+        self._invalidate_neighbor_index()
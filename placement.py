@@ -0,0 +1,63 @@
+import numpy as np
+
+# --- ROBOT PLACEMENT ---
+# Lattice sites are (i, j), 0-based: the robot 'count' of a full swarm sits at divmod(count, num_y).
+# In continuous placement every robot gets a real (float) position around its site:
+# - "square" packing: (i, j) * separation
+# - "hex" packing: odd rows shifted half a separation, rows sqrt(3)/2 separations apart
+# plus a gaussian jitter (std in separations). Missing robots leave their site empty.
+
+_HEX_ROW = np.sqrt(3) / 2
+
+
+def lattice_sites(num_x, num_y):
+    i, j = np.divmod(np.arange(num_x * num_y), num_y)
+    return np.column_stack((i, j))
+
+
+def site_positions(sites, separation, packing="square"):
+    """Real positions of the lattice sites (no jitter)"""
+
+    sites = np.asarray(sites, dtype=float)
+    if packing == "square":
+        return sites * separation
+    if packing == "hex":
+        x = sites[:, 0] + 0.5 * (sites[:, 1] % 2)
+        return np.column_stack((x, sites[:, 1] * _HEX_ROW)) * separation
+    raise ValueError(f"Unknown packing {packing!r}")
+
+
+def lattice_of(positions, separation, packing="square"):
+    """1-based lattice coordinates of the nearest site of every real position (inverse of site_positions)"""
+
+    positions = np.asarray(positions, dtype=float) / separation
+    if packing == "square":
+        sites = np.rint(positions)
+    elif packing == "hex":
+        j = np.rint(positions[:, 1] / _HEX_ROW)
+        i = np.rint(positions[:, 0] - 0.5 * (j % 2))
+        sites = np.column_stack((i, j))
+    else:
+        raise ValueError(f"Unknown packing {packing!r}")
+    return sites.astype(np.int64) + 1
+
+
+def place_robots(num_x, num_y, separation, packing, jitter, missing, rng):
+    """Real positions of the robots of a num_x x num_y lattice, in site order (missing sites left out)"""
+
+    sites = lattice_sites(num_x, num_y)
+    if missing:
+        sites = sites[rng.random(len(sites)) >= missing]
+    positions = site_positions(sites, separation, packing)
+    if jitter:
+        positions += rng.normal(0.0, jitter * separation, positions.shape)
+    return positions
+
+
+def grid_cells(positions, width, height):
+    """MultiGrid cell of every real position (nearest cell, inside the grid)"""
+
+    cells = np.rint(positions).astype(np.int64)
+    cells[:, 0] = cells[:, 0].clip(0, width - 1)
+    cells[:, 1] = cells[:, 1].clip(0, height - 1)
+    return cells
@@ -0,0 +1,190 @@
+import sys
+import time
+from collections import defaultdict
+import numpy as np
+import pandas as pd
+import model as model_module
+from agent import Kilobot
+from constant import State
+
+# --- PROFILING ---
+# Nothing is instrumented unless a Profiler is attached: the timed wrappers are
+# installed on attach() and removed on detach(), so a run without profiler runs
+# the plain methods. Times are inclusive (Kilobot.step includes broadcast_presence).
+
+# Kilobot methods timed by default: both activation phases, the hot helpers and every routine
+KILOBOT_METHODS = (
+    "step", "advance", "broadcast_presence", "send", "calculate_distance", "check_position",
+    "run_sr1a", "run_sr1b", "run_sr1c_collection", "determine_role",
+    "run_sr2a_origin_assignment", "setOriginAssignment", "setOriginNeighborsPosition",
+    "setRecDimension", "set_relative_position", "set_global_position",
+    "set_animation_sincronization", "set_role_color",
+)
+
+_STATE_NAMES = {value: name for name, value in vars(State).items() if not name.startswith("_")}
+
+
+class Profiler:
+    """Cumulative time and calls per (phase, method) and messages per phase of the attached model.
+
+    The phase of a Kilobot method is the state of its robot; the phase of the
+    model-level entries (scheduler, delivery, reporters) is the state of the
+    first working robot when the tick starts.
+    """
+
+    def __init__(self, methods=KILOBOT_METHODS):
+        self.methods = methods
+        self.timings = defaultdict(lambda: [0, 0.0])     # (phase, name) -> [calls, seconds]
+        self.traffic = defaultdict(lambda: [0, 0])       # phase -> [messages sent to receivers, delivered]
+        self.phase = None
+        self.model = None
+        self._restore = []
+
+    # --- Wrappers ---
+
+    def _timed(self, name, function, phase_of):
+        timings = self.timings
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                entry = timings[(phase_of(args), name)]
+                entry[0] += 1
+                entry[1] += time.perf_counter() - start
+        return timed
+
+    def _patch(self, owner, name, wrapper):
+        own = name in vars(owner)
+        original = vars(owner).get(name)
+        setattr(owner, name, wrapper)
+        self._restore.append((owner, name, own, original))
+
+    def _model_phase(self, args):
+        return self.phase
+
+    def _robot_phase(self, args):
+        return _STATE_NAMES.get(args[0].state)
+
+    def attach(self, model):
+        """Instrument the model (and the Kilobot class) until detach()"""
+
+        self.model = model
+        for name in self.methods:
+            self._patch(Kilobot, name, self._timed(name, getattr(Kilobot, name), self._robot_phase))
+
+        # Messages sent to every receiver in range, before losses
+        traffic = self.traffic
+        index = model.grid.neighbor_index
+        degree = np.diff(index.indptr)
+        if model.message_bus is None:
+            send = Kilobot.send
+
+            def send_direct(agent, *args, **kwargs):
+                traffic[self.phase][0] += int(degree[agent._row])
+                return send(agent, *args, **kwargs)
+            self._patch(Kilobot, "send", send_direct)
+        else:
+            bus = model.message_bus
+            deliver = bus.deliver
+
+            def deliver_posts():
+                traffic[self.phase][0] += int(degree[np.asarray(bus.senders, dtype=np.int64)].sum())
+                return deliver()
+            self._patch(bus, "deliver", deliver_posts)
+
+        repeated = model_module.count_repeated_broadcasts
+
+        def count_repeated_broadcasts(model, senders, ticks, nbytes):
+            traffic[self.phase][0] += int(degree[senders].sum()) * ticks
+            return repeated(model, senders, ticks, nbytes)
+        self._patch(model_module, "count_repeated_broadcasts", count_repeated_broadcasts)
+
+        # Model-level entries, on the instances
+        collector = model.datacollector
+        self._patch(model.schedule, "step", self._timed("scheduler", model.schedule.step, self._model_phase))
+        if model.message_bus is not None:
+            self._patch(model, "deliver_messages", self._timed("deliver_messages", model.deliver_messages, self._model_phase))
+        self._patch(collector, "_record", self._timed("reporters", collector._record, self._model_phase))
+        self._patch(model, "skip_quiescent_ticks",
+                    self._timed("fast_forward", model.skip_quiescent_ticks, self._model_phase))
+
+        step = model.step
+        swarm = model.swarm
+
+        # Messages delivered, from the per-robot counters: messages_total only keeps
+        # the working receivers (and drops the messages of a robot when it fails)
+        def tick():
+            working = swarm.working()
+            self.phase = _STATE_NAMES.get(int(swarm.state[:swarm.size][working][0])) if working.any() else None
+            delivered = int(swarm.messages[:swarm.size].sum())
+            step()
+            traffic[self.phase][1] += int(swarm.messages[:swarm.size].sum()) - delivered
+        self._patch(model, "step", self._timed("model_step", tick, self._model_phase))
+        return self
+
+    def detach(self):
+        for owner, name, own, original in reversed(self._restore):
+            if own:
+                setattr(owner, name, original)
+            else:
+                delattr(owner, name)
+        self._restore = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.detach()
+
+    # --- Report ---
+
+    def report(self):
+        """DataFrame of calls, seconds and microseconds per call of every (phase, name)"""
+
+        rows = [
+            {"phase": phase, "name": name, "calls": calls, "seconds": seconds}
+            for (phase, name), (calls, seconds) in self.timings.items()
+        ]
+        df = pd.DataFrame(rows, columns=["phase", "name", "calls", "seconds"])
+        df["us_per_call"] = 1e6 * df["seconds"] / df["calls"]
+        df["robots"] = self.model.swarm.size if self.model is not None else 0
+        return df.sort_values("seconds", ascending=False, ignore_index=True)
+
+    def messages(self):
+        """DataFrame of messages sent (to every receiver in range), delivered and lost per phase"""
+
+        rows = [
+            {"phase": phase, "sent": sent, "delivered": delivered, "lost": sent - delivered}
+            for phase, (sent, delivered) in self.traffic.items()
+        ]
+        return pd.DataFrame(rows, columns=["phase", "sent", "delivered", "lost"])
+
+    def dump(self, prefix):
+        """Write <prefix>_times.csv and <prefix>_messages.csv"""
+
+        self.report().to_csv(f"{prefix}_times.csv", index=False)
+        self.messages().to_csv(f"{prefix}_messages.csv", index=False)
+
+
+def profile(model):
+    """Profiler attached to the model: with profile(model) as profiler: ..."""
+    return Profiler().attach(model)
+
+
+if __name__ == "__main__":
+    # Profile a run:  python profiling.py [side_length] [max_steps]
+    side_length = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    max_steps = int(sys.argv[2]) if len(sys.argv) > 2 else 1350
+    model = model_module.KilobotFormationModel(side_length=side_length, delivery="vectorized", activation="active",
+                                               fast_forward=True, collect_when="final",
+                                               stop_when=f"phase:SET_ANIMATION_SINCRONIZATION@{max_steps}")
+    with profile(model) as profiler:
+        while model.running and model.schedule.steps <= max_steps:
+            model.step()
+        model.datacollector.collect(model)
+
+    pd.set_option("display.width", 200)
+    print(profiler.report().to_string())
+    print(profiler.messages().to_string())
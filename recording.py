@@ -0,0 +1,111 @@
+import json
+import os
+import sys
+import numpy as np
+from mesa import Model
+from mesa.time import BaseScheduler
+from constant import LED_COLORS
+
+# --- LED FRAME RECORDING ---
+# A recording is two files:
+#   <path>       one row of uint8 LED codes (index in LED_COLORS) per tick, one byte per robot
+#   <path>.json  robots, positions on the grid and palette (written before the first frame)
+# Row 0 is the swarm before the first tick, row t the swarm after tick t. The
+# frames are read through a memory map, so a replay only touches the rows it shows.
+
+
+class FrameRecorder:
+    """Appends the LED codes of a model's robots to a recording, one row per tick"""
+
+    def __init__(self, path, model):
+        self.path = path
+        self.robots = model.swarm.size
+        self.ticks = 0
+        meta = {
+            "robots": self.robots,
+            "width": model.grid.width,
+            "height": model.grid.height,
+            "x": [agent.pos[0] for agent in model.kilobots],
+            "y": [agent.pos[1] for agent in model.kilobots],
+            "palette": list(LED_COLORS),
+        }
+        with open(f"{path}.json", "w") as file:
+            json.dump(meta, file)
+        self._file = open(path, "wb")
+        self.record(model)
+
+    def record(self, model):
+        """Record the ticks run since the last call (a fast-forward jump repeats the current frame)"""
+
+        frame = model.swarm.led[:self.robots].tobytes()
+        while self.ticks <= model.schedule.steps:
+            self._file.write(frame)
+            self.ticks += 1
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def record_run(model, path, max_steps=1500):
+    """Run the model (like batch_run) recording every tick. Returns the number of frames"""
+
+    with FrameRecorder(path, model) as recorder:
+        while model.running and model.schedule.steps <= max_steps:
+            model.step()
+            recorder.record(model)
+    return recorder.ticks
+
+
+class FrameRecording:
+    """A recording opened for reading: frames[t] are the LED codes after tick t"""
+
+    def __init__(self, path):
+        with open(f"{path}.json") as file:
+            self.meta = json.load(file)
+        self.robots = self.meta["robots"]
+        ticks = os.path.getsize(path) // self.robots  # A torn last frame is ignored
+        self.frames = np.memmap(path, dtype=np.uint8, mode="r", shape=(ticks, self.robots))
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, tick):
+        return self.frames[tick]
+
+
+class ReplayModel(Model):
+    """Model that plays a recording, one frame per step (for server.py's replay mode)"""
+
+    def __init__(self, path, loop=False):
+        super().__init__()
+        self.recording = FrameRecording(path)
+        self.loop = loop
+        self.schedule = BaseScheduler(self)
+        self.running = True
+
+    def frame(self):
+        return self.recording[self.schedule.steps % len(self.recording)]
+
+    def step(self):
+        self.schedule.step()
+        if not self.loop and self.schedule.steps >= len(self.recording) - 1:
+            self.running = False
+
+
+if __name__ == "__main__":
+    # Record a run:  python recording.py <file> [side_length] [max_steps]
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python recording.py <file> [side_length] [max_steps]")
+    from model import KilobotFormationModel
+    side_length = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    max_steps = int(sys.argv[3]) if len(sys.argv) > 3 else 1500
+    model = KilobotFormationModel(side_length=side_length, delivery="vectorized", activation="active",
+                                  fast_forward=True, collect_when="manual")
+    frames = record_run(model, sys.argv[1], max_steps)
+    print(f"{frames} frames of {model.swarm.size} robots recorded in {sys.argv[1]}")
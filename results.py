@@ -0,0 +1,79 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+class ResultWriter:
+    """Line-oriented (JSON Lines) file where the rows of a sweep are appended as the runs finish.
+
+    Every line is flushed to disk when it is written, so a crash only loses the
+    runs in progress; a restarted sweep skips the runs whose RunKey is already
+    in the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def recorded_keys(self):
+        """RunKey of the runs already in the file (a torn last line is ignored)"""
+
+        keys = set()
+        if not os.path.exists(self.path):
+            return keys
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    keys.add(json.loads(line)["RunKey"])
+                except (json.JSONDecodeError, KeyError):
+                    continue
+        return keys
+
+    def append(self, row):
+        with open(self.path, "a") as file:
+            file.write(json.dumps(row, default=lambda value: value.item() if hasattr(value, "item") else str(value)) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+
+
+def read_chunks(path, chunksize=10000, columns=None):
+    """DataFrames of at most 'chunksize' rows of a results file (only 'columns' if given)"""
+
+    # No date parsing: pandas would read columns like Convergence_Time as timestamps
+    reader = pd.read_json(path, lines=True, chunksize=chunksize, dtype={"RunKey": str, "Code": str},
+                          convert_dates=False, keep_default_dates=False)
+    with reader:
+        for chunk in reader:
+            yield chunk if columns is None else chunk[columns]
+
+
+def aggregate(path, by, columns, chunksize=10000, where=None):
+    """
+    Count, mean and std (as DataFrame.groupby(by)[columns].agg(['count', 'mean', 'std'])) of a results file,
+    read in chunks: only the per-group count, sum and sum of squares are kept in memory.
+    'where' optionally selects the rows of a chunk (chunk -> boolean mask).
+    """
+
+    totals = None
+    for chunk in read_chunks(path, chunksize):
+        if where is not None:
+            chunk = chunk[where(chunk)]
+        values = chunk[columns].astype(float)
+        squares = values * values
+        squares[by] = values[by] = chunk[by]
+        part = pd.concat({
+            "count": values.groupby(by).count(),
+            "sum": values.groupby(by).sum(),
+            "sumsq": squares.groupby(by).sum(),
+        }, axis=1)
+        totals = part if totals is None else totals.add(part, fill_value=0)
+
+    if totals is None:
+        return pd.DataFrame(columns=pd.MultiIndex.from_product([columns, ["count", "mean", "std"]]))
+
+    count = totals["count"]
+    mean = totals["sum"] / count
+    variance = (totals["sumsq"] - count * mean * mean) / (count - 1)
+    std = np.sqrt(variance.clip(lower=0)).where(count > 1)
+    summary = pd.concat({"count": count.astype(int), "mean": mean, "std": std}, axis=1).swaplevel(axis=1)
+    return summary[[(column, stat) for column in columns for stat in ("count", "mean", "std")]]
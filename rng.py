@@ -0,0 +1,82 @@
+import hashlib
+import random
+import numpy as np
+
+
+def seed_key(seed, *words):
+    """64-bit key derived from a model seed and some integer words (tick, ...)
+
+    Mesa draws a float seed when none is given, so non-integer seeds are
+    hashed first. The same inputs always give the same key.
+    """
+
+    if isinstance(seed, (int, np.integer)) and seed >= 0:
+        base = int(seed)
+    else:
+        base = int.from_bytes(hashlib.sha256(repr(seed).encode()).digest()[:8], "little")
+    state = np.random.SeedSequence([base, *words]).generate_state(2, np.uint32)
+    return int(state[0]) | (int(state[1]) << 32)
+
+
+# Independent streams of a run, all derived from its key (see run_key)
+STREAM_RANDOM = 0     # random.Random of the model: IDs, failures, message loss (direct delivery)...
+STREAM_NUMPY = 1      # np.random.Generator of the model: bulk message loss
+STREAM_IR_NOISE = 2   # IR distance errors, counter-based per (tick, sender, receiver) (see channel.py)
+STREAM_FORK = 3       # Keys of the replicas forked from a checkpoint (see checkpoint.py)
+STREAM_PLACEMENT = 4  # Jitter and missing robots of the continuous placement (see placement.py)
+STREAM_LOSS = 5       # Lost messages, counter-based per (tick, sender, receiver) (see channel.LinkLoss)
+
+
+def run_key(seed, iteration=0):
+    """Key of one run of a sweep: the same (seed, iteration) always gives the same random streams"""
+    return seed_key(seed, iteration)
+
+
+def fork_key(key, tick, replica):
+    """Key of the replica 'replica' of a run forked at 'tick'"""
+    return seed_key(key, STREAM_FORK, tick, replica)
+
+
+def python_stream(key):
+    return random.Random(seed_key(key, STREAM_RANDOM))
+
+
+def numpy_stream(key):
+    return np.random.Generator(np.random.Philox(key=seed_key(key, STREAM_NUMPY)))
+
+
+def placement_stream(key):
+    return np.random.Generator(np.random.Philox(key=seed_key(key, STREAM_PLACEMENT)))
+
+
+# --- COUNTER-BASED DRAWS ---
+
+_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+
+def _mix(x):
+    # SplitMix64 finalizer (the caller ignores overflow)
+    x = (x ^ (x >> np.uint64(30))) * _MIX1
+    x = (x ^ (x >> np.uint64(27))) * _MIX2
+    return x ^ (x >> np.uint64(31))
+
+
+def counter_uniforms(key, tick, senders, receivers, lane=0):
+    """Uniforms in [0, 1) addressed by (key, tick, sender, receiver, lane), for any subset of pairs
+
+    Two SplitMix64 rounds: one over the pair of robots, one over (tick, lane).
+    Drawing only some pairs of a tick gives them the same values as drawing
+    all of them, whatever their order. Senders and receivers are robot rows
+    (non-negative, below 2**32), lane is 0..3.
+    """
+
+    shape = np.shape(senders)
+    senders = np.array(senders, dtype=np.uint64, ndmin=1)
+    receivers = np.array(receivers, dtype=np.uint64, ndmin=1)
+    with np.errstate(over="ignore"):
+        x = _mix(np.uint64(key) + ((senders << np.uint64(32)) | receivers) * _GAMMA)
+        x = _mix(x + np.uint64((int(tick) << 2) | lane) * _GAMMA)
+    uniforms = (x >> np.uint64(11)) * 2.0 ** -53
+    return uniforms.reshape(shape)
@@ -1,7 +1,7 @@
-import random
-from constant import R3_ANIMATION
+from constant import R3_ANIMATION, MessageKind
 
 class RoutineR1:
+    __slots__ = ()
 
     # ---------------------------------------------------------
     # SUBROUTINE SR1a: IDs Assignment
@@ -9,39 +9,49 @@ class RoutineR1:
     def run_sr1a(self):
         """If I hear a neighbor with MY same ID and different randomNumber, I change mine"""
 
-        for msg in self.inbox:
-            isAdded = False
-            for neighbor in self.neighbor_ids_randomNum:
-                if neighbor['id'] == msg['content']['sender_id']:
-                    isAdded = True
-            if not isAdded:
+        # Local copies of the swarm-store attributes read in the inner loop
+        my_id = self.my_id
+        my_random_number = self.randomNumber
+        rows = self.neighbor_rows
+
+        for msg in self.inbox.channel(MessageKind.ID_BEACON):
+            content = msg['content']
+            sender_id = content['sender_id']
+            if sender_id not in rows:
+                rows[sender_id] = len(self.neighbor_ids_randomNum)
                 self.neighbor_ids_randomNum.append({
-                    'id': msg['content']['sender_id'],
-                    'randomNumber': msg['content']['randomNumber']
+                    'id': sender_id,
+                    'randomNumber': content['randomNumber']
                 })
             # If a hear a neighbor with my ID but different randomNumber -> choose new ID and add current to blacklist
-            if (msg['content']['sender_id'] == self.my_id and msg['content']['randomNumber'] != self.randomNumber):
-                self.blacklist_ids.append(self.my_id)
-                new_id = random.randint(1, 255)
-                while new_id in self.blacklist_ids:
-                    new_id = random.randint(1, 255)
-                self.my_id = new_id
+            if (sender_id == my_id and content['randomNumber'] != my_random_number):
+                my_id = self.change_id(my_id)
             else:
-                # Check the neighbor list sent by the neighbor
-                for neighbor in msg['content']['neighbors']:
-                    # If a neighbor of my neighbor has my ID but different randomNumber -> choose new ID and add current to blacklist
-                    if neighbor['id'] == self.my_id and neighbor['randomNumber'] != self.randomNumber:
-                        self.blacklist_ids.append(self.my_id)
-                        new_id = random.randint(1, 255)
-                        while new_id in self.blacklist_ids:
-                            new_id = random.randint(1, 255)
-                        self.my_id = new_id
+                # Check the neighbor list sent by the neighbor, through its index of rows by ID.
+                # If a neighbor of my neighbor has my ID but different randomNumber -> choose new ID and add current to blacklist.
+                # Like a scan of the list, only the rows after the match are checked for the new ID
+                neighbors = content['neighbors']
+                row = content['rows'].get(my_id)
+                while row is not None and neighbors[row]['randomNumber'] != my_random_number:
+                    my_id = self.change_id(my_id)
+                    next_row = content['rows'].get(my_id)
+                    row = next_row if next_row is not None and next_row > row else None
 
             # Update minimum distance seen
             dist = msg['dist']
             if dist < self.min_dist_seen:
                 self.min_dist_seen = dist
 
+    def change_id(self, old_id):
+        """Add my ID to the blacklist and choose a new random one that isn't in it"""
+
+        self.blacklist_ids.add(old_id)
+        new_id = self.random.randint(1, 255)
+        while new_id in self.blacklist_ids:
+            new_id = self.random.randint(1, 255)
+        self.my_id = new_id
+        return new_id
+
     # ---------------------------------------------------------
     # SUBROUTINE SR1b: Neighbor list creation
     # ---------------------------------------------------------
@@ -54,12 +64,13 @@ class RoutineR1:
         threshold_r = self.min_dist_seen * 1.5 + 0.1
         
         # Build filtered list
-        for msg in self.inbox:
+        for msg in self.inbox.channel(MessageKind.NEIGHBOR_ID):
             if msg['dist'] <= threshold_r:
                 # msg content is the neighbor's ID
-                if msg['content'] not in self.neighbor_ids:
-                    if not isinstance(msg['content'], dict):
-                        self.neighbor_ids.append(msg['content'])
+                content = msg['content']
+                if content not in self.neighbor_id_set:
+                    self.neighbor_id_set.add(content)
+                    self.neighbor_ids.append(content)
             
 
     # ---------------------------------------------------------
@@ -68,11 +79,14 @@ class RoutineR1:
     def run_sr1c_collection(self):
         """Collect the number of neighbors that my neighbors have"""
 
-        for msg in self.inbox:
-            sender_id = msg['sender_id']
-            # In this phase, the content of the message is the neighbor's count
-            sender_count = msg['content'] 
-            self.neighbor_counts[sender_id] = sender_count
+        # On the first tick of the phase the messages are still the SR1b IDs, they are
+        # taken as counts until the neighbor sends its count
+        for kind in (MessageKind.NEIGHBOR_ID, MessageKind.NEIGHBOR_COUNT):
+            for msg in self.inbox.channel(kind):
+                sender_id = msg['sender_id']
+                # In this phase, the content of the message is the neighbor's count
+                sender_count = msg['content'] 
+                self.neighbor_counts[sender_id] = sender_count
 
 
     def determine_role(self):
@@ -103,40 +117,54 @@ class RoutineR1:
             self.role = "BORDER"
             self.led_color = "blue"  # Blue color
 
-        for msg in self.filter_neighbors_message():
-            if isinstance(msg['content'], dict):
-                neighborID = msg['content']['id']
-                exist = any(d["id"] == neighborID for d in self.neighbor_roles)
-                if not exist:
-                    self.neighbor_roles.append({
-                        'id': neighborID,
-                        'role': msg['content']['role']
-                    })
+        for msg in self.filter_neighbors_message(MessageKind.ROLE):
+            neighborID = msg['content']['id']
+            if neighborID not in self.neighbor_role_by_id:
+                self.neighbor_role_by_id[neighborID] = msg['content']['role']
+                self.neighbor_roles.append({
+                    'id': neighborID,
+                    'role': msg['content']['role']
+                })
+
+    def index_neighbor_roles(self):
+        """Role lookups used by R2, built once at the end of SR1c (the neighbor roles don't change later)"""
+
+        self.corner_neighbor_id = -1
+        self.border_neighbors = []
+        self.middle_neighbors = []
+        for robot in self.neighbor_roles:
+            if robot['role'] == "CORNER":
+                self.corner_neighbor_id = robot['id']  # The last CORNER heard
+            elif robot['id'] in self.neighbor_id_set and robot['role'] == "BORDER":
+                self.border_neighbors.append(robot)
+            elif robot['id'] in self.neighbor_id_set and robot['role'] == "MIDDLE":
+                self.middle_neighbors.append(robot)
 
 
 
 class RoutineR2:
+    __slots__ = ()
+
     def run_sr2a_origin_assignment(self):
         """Assign origin based on received numbers"""
         
-        for msg in self.filter_neighbors_message():
+        for msg in self.filter_neighbors_message(MessageKind.ORIGIN_NUMBER):
             received_num = msg['content']
-            if isinstance(received_num, int):
-                if self.role != "CORNER": 
-                    if received_num is not None and received_num < self.numOriginAssigment:
-                        self.numOriginAssigment = received_num
-                        self.led_color = "pink"  # Pink indicates that I updated my number
-                elif self.role == "CORNER":
-                    if self.numOriginAssigment == received_num: # If corner receives its own number, 
-                        self.led_color = "black"                # it will be the origin at the end of the phase 
-                    else:
-                        self.led_color = "purple"
+            if self.role != "CORNER": 
+                if received_num is not None and received_num < self.numOriginAssigment:
+                    self.numOriginAssigment = received_num
+                    self.led_color = "pink"  # Pink indicates that I updated my number
+            elif self.role == "CORNER":
+                if self.numOriginAssigment == received_num: # If corner receives its own number, 
+                    self.led_color = "black"                # it will be the origin at the end of the phase 
+                else:
+                    self.led_color = "purple"
 
 
     def setOriginAssignment(self):
         """Set origin position based on assigned number"""
         
-        for msg in self.filter_neighbors_message():
+        for msg in self.filter_neighbors_message(MessageKind.ORIGIN_NUMBER):
             received_num = msg['content']
             if self.role != "CORNER":
                self.led_color = "gray"
@@ -151,17 +179,16 @@ class RoutineR2:
     def setOriginNeighborsPosition(self):
         """Origin [1,1] sends positions to BORDER and MIDDLE neighbors"""
         
-        for msg in self.filter_neighbors_message():
-            if isinstance(msg['content'], list):
-                for content in msg['content']:
-                    if content['id'] == self.my_id:
-                        self.position = content['position'] # Set my position based on the message
-                        if self.position == [1,2]: # Depending on my position, set LED color
-                            self.led_color = "red"
-                        elif self.position == [2,1]:
-                            self.led_color = "blue"
-                        elif self.position == [2,2]:
-                            self.led_color = "green"
+        for msg in self.filter_neighbors_message(MessageKind.ORIGIN_POSITIONS):
+            for content in msg['content']:
+                if content['id'] == self.my_id:
+                    self.position = content['position'] # Set my position based on the message
+                    if self.position == [1,2]: # Depending on my position, set LED color
+                        self.led_color = "red"
+                    elif self.position == [2,1]:
+                        self.led_color = "blue"
+                    elif self.position == [2,2]:
+                        self.led_color = "green"
             
     # ---------------------------------------------------------
     # SUBROUTINE SR2B: Rectangle dimension setting
@@ -171,13 +198,10 @@ class RoutineR2:
 
         # BORDER robots update their count message if they have count = 0 and have received a message
         if self.count == 0 and self.role == "BORDER" and not self.position:
-            for msg in self.filter_neighbors_message():
+            for msg in self.filter_neighbors_message(MessageKind.COUNT):
                 content = msg['content']
-                if isinstance(content, dict) and "count" in content and not ("corner_id" in content):   
-                    self.messageFromCorner = False
-                    for robot in self.neighbor_roles:
-                        if robot['id'] == msg["sender_id"] and robot['role'] == "CORNER":
-                            self.messageFromCorner = True
+                if not ("corner_id" in content):   
+                    self.messageFromCorner = self.neighbor_role_by_id.get(msg["sender_id"]) == "CORNER"
                             
                     self.count = content['count'] + 1
                     self.countMessage = content
@@ -185,9 +209,9 @@ class RoutineR2:
         
         # The same to CORNER robots
         elif self.count == 0 and self.role == "CORNER" and not self.position:
-            for msg in self.filter_neighbors_message():
+            for msg in self.filter_neighbors_message(MessageKind.COUNT):
                 content = msg['content']
-                if isinstance(content, dict) and "count" in content and "corner_id" in content:
+                if "corner_id" in content:
                     content = msg['content']
                     self.count = content['count'] + 1
                     self.countMessage = content                
@@ -195,22 +219,19 @@ class RoutineR2:
                 # - Specific cases for positions [1,2] and [1,1]
         # We have to ensure that [1,2] don't update its count from [2,1], so we check the count if it is greater than 2
         elif self.position == [1,2] and self.count == 0:
-            for msg in self.filter_neighbors_message():
+            for msg in self.filter_neighbors_message(MessageKind.COUNT):
                 content = msg['content']
-                if isinstance(content, dict) and "count" in content:
-                    if content['count'] > 2:
-                        self.count = content['count'] + 1
-                        self.countMessage = content
+                if content['count'] > 2:
+                    self.count = content['count'] + 1
+                    self.countMessage = content
         
         # If count message is from [1,2] to [1,1] updates its count and the final countMessage
         elif self.position == [1,1]:
-            for msg in self.filter_neighbors_message():
+            for msg in self.filter_neighbors_message(MessageKind.COUNT):
                 content = msg['content']
-                if isinstance(content, dict) and "count" in content:
-                    content = msg['content']
-                    self.count = 1
-                    if content['count'] > 3:
-                        self.countMessage = content
+                self.count = 1
+                if content['count'] > 3:
+                    self.countMessage = content
         
 
     def set_relative_position(self):
@@ -223,26 +244,24 @@ class RoutineR2:
             self.countFullMessage = self.countMessage
         
         else:
-            for msg in self.filter_neighbors_message():
-                if msg['content'] and isinstance(msg['content'], dict) and "check" in msg['content']:
-                    #print("Robot", self.my_id, "at", self.position, "received countFullMessage from neighbor:", msg['content'])
-                    self.countFullMessage = msg['content']
+            for msg in self.filter_neighbors_message(MessageKind.FULL_COUNT):
+                #print("Robot", self.my_id, "at", self.position, "received countFullMessage from neighbor:", msg['content'])
+                self.countFullMessage = msg['content']
 
 
         # For other BORDER or CORNER robots, set their position based on the countFullMessage and their count
         if not self.position and (self.role == "BORDER" or self.role == "CORNER") and not (self.countFullMessage is None):
-            for msg in self.filter_neighbors_message():
-                if msg['content'] and not ("sender_position" in msg):
-                    self.countFullMessage = msg['content']
-
-                    if self.countMessage['count'] < self.countFullMessage['C1']:
-                        self.position = [self.count, 1]
-                    elif self.countFullMessage['C1'] < self.count <= self.countFullMessage['C2']:
-                        self.position = [self.countFullMessage['C1'], self.count - self.countFullMessage['C1'] + 1]
-                    elif self.countFullMessage['C2'] < self.count <= self.countFullMessage['C3']:
-                        self.position = [self.countFullMessage['C1'] - (self.count - self.countFullMessage['C2']), self.countFullMessage['C2'] - self.countFullMessage['C1'] + 1]
-                    else:
-                        self.position = [1, (self.countFullMessage['C2'] - self.countFullMessage['C1'] + 1) - (self.count - self.countFullMessage['C3'])]
+            for msg in self.filter_neighbors_message(MessageKind.FULL_COUNT):
+                self.countFullMessage = msg['content']
+
+                if self.countMessage['count'] < self.countFullMessage['C1']:
+                    self.position = [self.count, 1]
+                elif self.countFullMessage['C1'] < self.count <= self.countFullMessage['C2']:
+                    self.position = [self.countFullMessage['C1'], self.count - self.countFullMessage['C1'] + 1]
+                elif self.countFullMessage['C2'] < self.count <= self.countFullMessage['C3']:
+                    self.position = [self.countFullMessage['C1'] - (self.count - self.countFullMessage['C2']), self.countFullMessage['C2'] - self.countFullMessage['C1'] + 1]
+                else:
+                    self.position = [1, (self.countFullMessage['C2'] - self.countFullMessage['C1'] + 1) - (self.count - self.countFullMessage['C3'])]
                    
 
     # ---------------------------------------------------------
@@ -255,9 +274,8 @@ class RoutineR2:
 
         # If I am MIDDLE and I don't have position yet, check neighbors' positions to determine mine
         if not self.position and self.role == "MIDDLE":
-            for msg in self.filter_neighbors_message():
-                if msg['content'] and isinstance(msg['content'], list):
-                    self.neighbor_positions.append(msg['content'])
+            for msg in self.filter_neighbors_message(MessageKind.POSITION):
+                self.neighbor_positions.append(msg['content'])
             if self.neighbor_positions:
                 # Check if I can determine my position (coordinates x or y) based on neighbors' positions
                 self.check_position(self.neighbor_positions)
@@ -268,6 +286,8 @@ class RoutineR2:
 
 
 class RoutineR3:
+    __slots__ = ()
+
     def set_animation_sincronization(self):
         if not self.position or self.position == [-1, -1]:
             self.led_color = "grey"
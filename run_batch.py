@@ -1,13 +1,29 @@
+import sys
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-from mesa.batchrunner import batch_run
+from cache import code_version, iter_batch_run
 from model import KilobotFormationModel
+from results import ResultWriter, aggregate
+from workqueue import WorkQueue, work_locally
 
 # --- SCALABILITY CONFIGURATION ---
 
 # No fixed size parameters, now they are variable.
-fixed_params = {}
+# Sweeps use the bulk delivery engine and the active-set scheduler, they are much faster for big swarms
+# and give the same results as direct delivery and full activation (see equivalence.py).
+# Quiescent ticks are fast-forwarded (their messages are only counted), the runs stop
+# in R3 once the last failure check within MAX_STEPS has run (the animation ticks don't
+# change the metrics, failures do: 1301 of 1351 steps, ~4% fewer) and only the final values
+# are collected (data_collection_period=-1)
+MAX_STEPS = 1350
+fixed_params = {
+    "delivery": "vectorized",
+    "activation": "active",
+    "fast_forward": True,
+    "stop_when": f"phase:SET_ANIMATION_SINCRONIZATION@{MAX_STEPS}",
+    "collect_when": "final",
+}
 
 variable_params = {
     # SIZES TO TEST:
@@ -24,40 +40,103 @@ variable_params = {
 
 
 NUM_ITERATIONS = 25
-MAX_STEPS = 1350
+SEED = 2024  # Seed of the sweep, every run gets its streams from (SEED, iteration)
+RESULTS_FILE = "runs.jsonl"  # One line per finished run, a restarted sweep skips the runs already in it
+CHUNK_SIZE = 10000
+
+GROUP_BY = ['Total_Robots', 'ir_error', 'lost_message_prob', 'failure_prob']
+METRICS = ['Accuracy', 'Convergence_Time', 'Avg_Messages', 'Avg_Message_Bytes']
+Z_95 = 1.96  # Normal quantile of the 95% confidence interval of a cell's mean
+
+def sweep_parameters():
+    # The iterations are a parameter of the model, so every run is reproducible in any process and
+    # the same iteration uses the same random numbers in every cell (common random numbers)
+    return {**fixed_params, **variable_params, "seed": SEED, "iteration": range(NUM_ITERATIONS)}
+
+def record(rows, writer):
+    """Append the rows to the results file of 'writer'"""
+
+    for row in rows:
+        # Calculate the total number of robots so the graph is clearer
+        # (side_length 5 becomes "25 Robots")
+        row['Total_Robots'] = row['side_length'] * row['side_length']
+        writer.append(row)
 
 def run_experiment():
     print(f"Starting scalability test...")
     print(f"Testing sizes: {variable_params['side_length']}")
 
-    params = {**fixed_params, **variable_params}
+    params = sweep_parameters()
 
-    results = batch_run(
+    # Like batch_run (final values only), but the runs already in the local cache (.cache/, keyed
+    # by parameters, seed, iteration and model code version) are not computed again.
+    # Every run is appended to RESULTS_FILE as soon as it finishes, so an interrupted
+    # sweep loses only the runs in progress
+    writer = ResultWriter(RESULTS_FILE)
+    rows = iter_batch_run(
         KilobotFormationModel,
         parameters=params,
-        iterations=NUM_ITERATIONS,
         max_steps=MAX_STEPS,
         number_processes=None, 
-        data_collection_period=-1, 
-        display_progress=True
+        display_progress=True,
+        skip=writer.recorded_keys()
     )
 
-    df = pd.DataFrame(results)
-    
-    # Calculate the total number of robots so the graph is clearer
-    # (side_length 5 becomes "25 Robots")
-    df['Total_Robots'] = df['side_length'] * df['side_length']
-    
-    return df
-
-def analyze_scalability(df):
-    
-    # Summary statistics
-    summary = df.groupby(['Total_Robots', 'ir_error', 'lost_message_prob', 'failure_prob'])[['Accuracy', 'Convergence_Time', 'Avg_Messages']].agg(['mean', 'std'])
+    record(rows, writer)
+    return RESULTS_FILE
+
+# --- MULTI-HOST SWEEPS ---
+# 1. python run_batch.py submit <dir>                    (once, <dir> shared by every host)
+# 2. python workqueue.py <dir> [procs] [stale timeout]   (on every host, any number of times)
+# 3. python run_batch.py collect <dir>                   (when the queue is empty: results and charts)
+
+def submit_experiment(queue_dir):
+    added = WorkQueue(queue_dir).submit(sweep_parameters(), MAX_STEPS)
+    print(f"{added} runs submitted to {queue_dir}")
+
+def collect_experiment(queue_dir):
+    """Append the finished runs of the queue that aren't in RESULTS_FILE yet"""
+
+    queue = WorkQueue(queue_dir)
+    print(f"Queue status: {queue.status()}")
+    writer = ResultWriter(RESULTS_FILE)
+    recorded = writer.recorded_keys()
+    record((row for row in queue.results() if row['RunKey'] not in recorded), writer)
+    return RESULTS_FILE
+
+def with_ci(summary):
+    """Add the half-width of the 95% confidence interval of the mean of every metric ('ci95')"""
+
+    columns = list(summary.columns.get_level_values(0).unique())
+    for column in columns:
+        summary[(column, 'ci95')] = Z_95 * summary[(column, 'std')] / summary[(column, 'count')] ** 0.5
+    return summary[[(column, stat) for column in columns for stat in ('count', 'mean', 'std', 'ci95')]]
+
+def spread(summary):
+    """
+    Three rows per cell, at mean - ci95, mean and mean + ci95: their mean and their
+    whole range (errorbar=("pi", 100)) are the cell's mean and its confidence interval,
+    so seaborn draws the bands and error bars from the summary alone
+    """
+
+    means = summary.xs('mean', axis=1, level=1)
+    half_widths = summary.xs('ci95', axis=1, level=1).fillna(0)  # A single run has no interval
+    return pd.concat([means - half_widths, means, means + half_widths]).reset_index()
+
+def analyze_scalability(path):
+
+    # Summary statistics, read in chunks (only the runs of the current model code)
+    version = code_version()
+    current = lambda chunk: chunk['Code'] == version
+    summary = with_ci(aggregate(path, GROUP_BY, METRICS, CHUNK_SIZE, where=current))
     print("\n--- SCALABILITY SUMMARY ---")
     print(summary)
     summary.to_csv("results.csv")
 
+    # The charts plot the mean of every cell and its 95% confidence interval
+    df = spread(summary)
+    interval = ("pi", 100)
+
     sns.set(style="whitegrid", font_scale=1.1)
 
     # --- CHART 1: ACCURACY ---
@@ -74,6 +153,7 @@ def analyze_scalability(df):
         dashes=False,
         linewidth=2.5,
         palette="viridis",
+        errorbar=interval,
         height=4,
         aspect=1.2
     )
@@ -90,7 +170,9 @@ def analyze_scalability(df):
     print("Clean accuracy chart saved")
 
     # --- CHART 2: TIME ---
-    df_converged = df[df['Convergence_Time'] > 0]
+    converged = lambda chunk: current(chunk) & (chunk['Convergence_Time'] > 0)
+    df_converged = aggregate(path, GROUP_BY, ['Convergence_Time'], CHUNK_SIZE, where=converged)
+    df_converged = spread(with_ci(df_converged))
 
     if not df_converged.empty:
         g2 = sns.relplot(
@@ -106,6 +188,7 @@ def analyze_scalability(df):
             dashes=False,
             linewidth=2.5,
             palette="magma",
+            errorbar=interval,
             height=4,
             aspect=1.2
         )
@@ -127,6 +210,7 @@ def analyze_scalability(df):
         col="lost_message_prob",
         row="failure_prob",
         palette="Blues_d",
+        errorbar=interval,
         height=4,
         aspect=1.2
     )
@@ -141,5 +225,16 @@ def analyze_scalability(df):
     plt.show()
 
 if __name__ == "__main__":
-    df_results = run_experiment()
-    analyze_scalability(df_results)
\ No newline at end of file
+    mode = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if mode == "submit":
+        submit_experiment(sys.argv[2])
+    elif mode == "queue":
+        # Work queue on this machine only (a stand-in for several hosts)
+        submit_experiment(sys.argv[2])
+        work_locally(sys.argv[2])
+        analyze_scalability(collect_experiment(sys.argv[2]))
+    elif mode == "collect":
+        analyze_scalability(collect_experiment(sys.argv[2]))
+    else:
+        results_file = run_experiment()
+        analyze_scalability(results_file)
\ No newline at end of file
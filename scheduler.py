@@ -0,0 +1,162 @@
+import numpy as np
+from mesa.time import BaseScheduler
+from constant import State, ROLES, PHASE_TIMERS, FAILURE_CHECK_PERIOD, FAILURE_CHECK_TICK
+from messaging import MessageList
+
+_CORNER = ROLES.index("CORNER")
+_BORDER = ROLES.index("BORDER")
+_MIDDLE = ROLES.index("MIDDLE")
+
+# Phases whose work can be over long before their timer ends (see quiescent)
+FAST_FORWARD_STATES = (State.SR2B_SET_REC_DIMENSION, State.SR2B_SET_RELATIVE_POS, State.SR2C_SET_GLOBAL_POS)
+
+
+def _at(swarm, x, y):
+    """Mask of the robots whose position is [x, y]"""
+
+    position = swarm.position[:swarm.size]
+    return swarm.has_position[:swarm.size] & (position[:, 0] == x) & (position[:, 1] == y)
+
+
+def may_broadcast(swarm):
+    """Mask of the robots whose broadcast_presence may send something this tick"""
+
+    state = swarm.state[:swarm.size]
+    role = swarm.role[:swarm.size]
+    count = swarm.count[:swarm.size]
+    has_position = swarm.has_position[:swarm.size]
+
+    # SR1 and SR2a (phases 1 and 2) send every tick, as SR2c (even an empty message)
+    mask = (state <= State.SR2A_SET_ORIGIN) | (state == State.SR2C_SET_GLOBAL_POS)
+
+    # SR2a phase 3: only the origin [1,1]
+    mask |= (state == State.SR2A_ORIGIN_SET_POSITION) & _at(swarm, 1, 1)
+
+    # SR2b phase 1: BORDER robots with a count ([2,1] starts it) and CORNER robots with a count but no position
+    mask |= (state == State.SR2B_SET_REC_DIMENSION) & (
+        ((role == _BORDER) & ((count > 0) | _at(swarm, 2, 1)))
+        | ((role == _CORNER) & (count > 0) & ~has_position)
+    )
+
+    # SR2b phase 2: the robots holding the full count message (not stored in the swarm columns)
+    mask |= state == State.SR2B_SET_RELATIVE_POS
+
+    # R3 doesn't send anything
+    return mask
+
+
+def reads_inbox(swarm):
+    """Mask of the robots whose advance may use the messages they received"""
+
+    state = swarm.state[:swarm.size]
+    role = swarm.role[:swarm.size]
+    count = swarm.count[:swarm.size]
+    has_position = swarm.has_position[:swarm.size]
+
+    mask = (state != State.SR2B_SET_REC_DIMENSION) & (state != State.SR2C_SET_GLOBAL_POS)
+
+    # SR2b phase 1: robots still waiting for their count, and the origin closing the count
+    mask |= (state == State.SR2B_SET_REC_DIMENSION) & (
+        (((role == _BORDER) | (role == _CORNER)) & (count == 0) & ~has_position)
+        | (_at(swarm, 1, 2) & (count == 0))
+        | _at(swarm, 1, 1)
+    )
+
+    # SR2c: MIDDLE robots without position
+    mask |= (state == State.SR2C_SET_GLOBAL_POS) & (role == _MIDDLE) & ~has_position
+    return mask
+
+
+def quiescent(model):
+    """True if no working robot can change anything until the next phase boundary.
+
+    Only checked in FAST_FORWARD_STATES, where the robots that are done keep
+    broadcasting the same content and ignore what they receive:
+    - SR2b phase 1: every BORDER and CORNER has its count and the origin [1,1]
+      has the final count message (count > 3, only sent by [1,2]).
+    - SR2b phase 2: every robot holds the full count message and every BORDER
+      and CORNER has its position.
+    - SR2c: every MIDDLE has its position.
+    """
+
+    swarm = model.swarm
+    working = swarm.working()
+    states = np.unique(swarm.state[:swarm.size][working])
+    if len(states) != 1 or states[0] not in FAST_FORWARD_STATES:
+        return False
+    state = states[0]
+
+    kilobots = model.kilobots
+    if state == State.SR2B_SET_RELATIVE_POS:
+        role = swarm.role[:swarm.size]
+        waiting = working & ((role == _BORDER) | (role == _CORNER)) & ~swarm.has_position[:swarm.size]
+        if waiting.any():
+            return False
+        return all(kilobots[row].countFullMessage is not None for row in np.flatnonzero(working).tolist())
+
+    waiting = working & reads_inbox(swarm)
+    if state == State.SR2B_SET_REC_DIMENSION:
+        origin = _at(swarm, 1, 1)
+        for row in np.flatnonzero(waiting & origin).tolist():
+            if kilobots[row].count != 1 or kilobots[row].countMessage["count"] <= 3:
+                return False
+        waiting &= ~origin
+    return not waiting.any()
+
+
+def ticks_to_boundary(clock):
+    """Ticks that can be skipped from 'clock' before a phase timer or a failure check is due"""
+
+    next_timer = min((t for t in PHASE_TIMERS if t > clock), default=clock + 1)
+    next_check = clock + (FAILURE_CHECK_TICK - clock) % FAILURE_CHECK_PERIOD
+    # The tick that starts at 'next_check', or ends at 'next_timer', has to run
+    return max(min(next_timer - 1, next_check) - clock, 0)
+
+
+class ActiveSetActivation(BaseScheduler):
+    """Simultaneous activation restricted to the robots that have something to do.
+
+    A robot is stepped if it may broadcast or its failure check is due, and
+    advanced if it received messages it reads, a phase timer is due or it runs
+    an animation (R3). The rest only tick their internal clock, in bulk on the
+    swarm columns. Broken robots are skipped. Agents are visited in the same
+    order as SimultaneousActivation, so the outcome is the same as with full
+    activation.
+    """
+
+    def step(self):
+        model = self.model
+        swarm = model.swarm
+        kilobots = model.kilobots
+        n = swarm.size
+
+        # --- Step phase ---
+        working = swarm.working()
+        clock = swarm.clock[:n]
+        failure_due = clock % FAILURE_CHECK_PERIOD == FAILURE_CHECK_TICK
+        stepping = failure_due | (working & may_broadcast(swarm))
+
+        received_before = swarm.messages[:n].copy()
+        for row in np.flatnonzero(stepping).tolist():
+            kilobots[row].step()
+        clock[working & ~stepping] += 1
+
+        if model.message_bus is not None:
+            model.deliver_messages()
+
+        # --- Advance phase ---
+        working = swarm.working()
+        received = swarm.messages[:n] != received_before
+        advancing = working & (
+            (received & reads_inbox(swarm))
+            | np.isin(clock, PHASE_TIMERS)
+            | (swarm.state[:n] >= State.SET_ANIMATION_SINCRONIZATION)
+        )
+        # Messages that won't be read are dropped, as advance would do
+        for row in np.flatnonzero(working & received & ~advancing).tolist():
+            kilobots[row].inbox = MessageList()
+        for row in np.flatnonzero(advancing).tolist():
+            kilobots[row].advance()
+
+        self.steps += 1
+        self.time += 1
@@ -1,6 +1,9 @@
+import sys
 from mesa.visualization.modules import CanvasGrid
 from mesa.visualization.ModularVisualization import ModularServer
 from model import KilobotFormationModel
+from recording import ReplayModel, FrameRecording
+from visualization import DeltaCanvasGrid, ReplayCanvasGrid
 from constant import State, KILOBOTS_X, KILOBOTS_Y, GRID_SIZE, SEPARATION
 
 # --- VISUALIZATION ---
@@ -37,14 +40,27 @@ canvas_height = KILOBOTS_Y * SEPARATION
 
 pixel_width = canvas_width * GRID_SIZE
 pixel_height = canvas_height * GRID_SIZE
-grid = CanvasGrid(agent_portrayal, canvas_width, canvas_height, pixel_width, pixel_height)
+# Only the robots whose color or label changed are sent to the browser every tick.
+# CanvasGrid with agent_portrayal draws the same frames but sends every robot every tick
+DELTA_FRAMES = True
 
+# Replay mode: python server.py --replay <file>  (a recording made with recording.py, no simulation)
+if "--replay" in sys.argv:
+    path = sys.argv[sys.argv.index("--replay") + 1]
+    meta = FrameRecording(path).meta
+    replay_grid = ReplayCanvasGrid(meta["width"], meta["height"], meta["width"] * GRID_SIZE, meta["height"] * GRID_SIZE)
+    server = ModularServer(ReplayModel, [replay_grid], "Kilobots (replay)", {"path": path})
+else:
+    if DELTA_FRAMES:
+        grid = DeltaCanvasGrid(canvas_width, canvas_height, pixel_width, pixel_height)
+    else:
+        grid = CanvasGrid(agent_portrayal, canvas_width, canvas_height, pixel_width, pixel_height)
 
-server = ModularServer(
-    KilobotFormationModel,
-    [grid],
-    "Kilobots"
-)
+    server = ModularServer(
+        KilobotFormationModel,
+        [grid],
+        "Kilobots"
+    )
 
 server.port = 8521
 
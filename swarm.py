@@ -0,0 +1,228 @@
+import numpy as np
+from constant import ROLES, LED_COLORS
+
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+_LED_CODES = {color: code for code, color in enumerate(LED_COLORS)}
+
+
+class SwarmState:
+    """Scalar state of every robot of the swarm, held in typed NumPy columns.
+
+    Row i belongs to the i-th Kilobot created; Kilobot is a thin view over
+    its row, so whole-swarm queries (reporters, schedulers) can work on the
+    columns directly.
+    """
+
+    def __init__(self, capacity):
+        self.size = 0
+        self.state = np.zeros(capacity, dtype=np.uint8)
+        self.clock = np.zeros(capacity, dtype=np.int32)          # internal_clock
+        self.my_id = np.zeros(capacity, dtype=np.uint8)
+        self.random_number = np.zeros(capacity, dtype=np.uint8)
+        self.role = np.zeros(capacity, dtype=np.uint8)           # Index in ROLES
+        self.count = np.zeros(capacity, dtype=np.int32)
+        self.position = np.zeros((capacity, 2), dtype=np.int32)
+        self.has_position = np.zeros(capacity, dtype=bool)       # False -> position is []
+        self.broken = np.zeros(capacity, dtype=bool)
+        self.led = np.zeros(capacity, dtype=np.uint8)            # Index in LED_COLORS
+        self.messages = np.zeros(capacity, dtype=np.int64)       # messages_sent_count
+        self.message_bytes = np.zeros(capacity, dtype=np.int64)  # message_bytes_count
+        self.home = np.zeros((capacity, 2), dtype=np.int32)      # Real 1-based lattice position
+        self.converged_at = np.full(capacity, -1, dtype=np.int32)  # Clock when it got its position
+
+        # Running totals over the working robots, updated on every event
+        # (position set, robot broken, message counted) so reporters don't scan the columns
+        self.working_count = 0
+        self.located_count = 0
+        self.error_total = 0          # Manhattan error of the located robots
+        self.messages_total = 0
+        self.message_bytes_total = 0
+
+    def _columns(self):
+        return [name for name, value in vars(self).items() if isinstance(value, np.ndarray)]
+
+    def add(self):
+        """Reserve the row of a new robot.
+
+        A new row holds the initial state of a Kilobot: every column is 0
+        (State.SR1A_ID_ASSIGNMENT, ROLES[0] "UNDECIDED", LED_COLORS[0] "grey",
+        not broken, no position, no messages) except converged_at, -1.
+        """
+
+        if self.size == len(self.state):
+            for name in self._columns():
+                column = getattr(self, name)
+                grown = np.zeros((max(2 * len(column), 1),) + column.shape[1:], dtype=column.dtype)
+                grown[:len(column)] = column
+                setattr(self, name, grown)
+        self.converged_at[self.size] = -1
+        self.working_count += 1
+        self.size += 1
+        return self.size - 1
+
+    def working(self):
+        """Mask of the robots that are not broken"""
+        return ~self.broken[:self.size]
+
+    def located(self):
+        """Mask of the robots with a valid position"""
+
+        position = self.position[:self.size]
+        return self.has_position[:self.size] & ~((position[:, 0] == -1) & (position[:, 1] == -1))
+
+    def converged(self):
+        """True if every working robot has a valid position"""
+        return self.working_count > 0 and self.located_count == self.working_count
+
+    # --- Events that keep the running totals ---
+
+    def _is_located(self, row):
+        return self.has_position.item(row) and not (self.position.item(row, 0) == -1 and self.position.item(row, 1) == -1)
+
+    def _error(self, row):
+        return abs(self.position.item(row, 0) - self.home.item(row, 0)) + abs(self.position.item(row, 1) - self.home.item(row, 1))
+
+    def _track(self, row, sign):
+        """Add (sign=1) or remove (sign=-1) the row from the totals of the working robots"""
+
+        self.working_count += sign
+        self.messages_total += sign * self.messages.item(row)
+        self.message_bytes_total += sign * self.message_bytes.item(row)
+        if self._is_located(row):
+            self.located_count += sign
+            self.error_total += sign * self._error(row)
+
+    def set_position(self, row, value):
+        """Set the global position of a robot ([] -> unknown)"""
+
+        working = not self.broken.item(row)
+        previous = self.position[row].tolist() if self._is_located(row) else None
+        if working:
+            self._track(row, -1)
+        if value:
+            self.position[row] = value
+            self.has_position[row] = True
+        else:
+            self.has_position[row] = False
+
+        # The convergence tick of a robot is when it got its current valid position
+        if not self._is_located(row):
+            self.converged_at[row] = -1
+        elif self.position[row].tolist() != previous:
+            self.converged_at[row] = self.clock[row]
+        if working:
+            self._track(row, 1)
+
+    def set_broken(self, row, broken):
+        if broken != self.broken.item(row):
+            self._track(row, -1 if broken else 1)
+            self.broken[row] = broken
+
+    def set_home(self, lattice, rows=None):
+        """Set the real lattice positions of the robots in 'rows' (the first len(lattice) robots by default)"""
+
+        rows = np.arange(len(lattice)) if rows is None else np.asarray(rows)
+        if len(rows):
+            tracked = rows[~self.broken[rows] & self.located()[rows]].tolist()
+            for row in tracked:
+                self.error_total -= self._error(row)
+            self.home[rows] = lattice
+            for row in tracked:
+                self.error_total += self._error(row)
+
+    def count_message(self, row, nbytes):
+        """Count one message of 'nbytes' received by a robot"""
+
+        self.messages[row] += 1
+        self.message_bytes[row] += nbytes
+        if not self.broken.item(row):
+            self.messages_total += 1
+            self.message_bytes_total += nbytes
+
+    def count_messages(self, counts, nbytes):
+        """Count the messages received by the first len(counts) robots (and their bytes)"""
+
+        n = len(counts)
+        self.messages[:n] += counts
+        self.message_bytes[:n] += nbytes
+        working = ~self.broken[:n]
+        self.messages_total += int(counts[working].sum())
+        self.message_bytes_total += int(nbytes[working].sum())
+
+
+# ---------------------------------------------------------
+# Kilobot attributes stored in the swarm columns
+# ---------------------------------------------------------
+
+def column(name):
+    """Integer attribute stored in a column of the swarm"""
+
+    def fget(self):
+        return getattr(self._swarm, name).item(self._row)
+
+    def fset(self, value):
+        getattr(self._swarm, name)[self._row] = value
+
+    return property(fget, fset)
+
+
+def coded_column(name, codes, values):
+    """Attribute stored as a small code in a column of the swarm (roles, LED colors)"""
+
+    def fget(self):
+        return values[getattr(self._swarm, name).item(self._row)]
+
+    def fset(self, value):
+        getattr(self._swarm, name)[self._row] = codes[value]
+
+    return property(fget, fset)
+
+
+def counter_column(name, total):
+    """Message counter stored in a column, its changes are added to the running 'total'"""
+
+    def fget(self):
+        return getattr(self._swarm, name).item(self._row)
+
+    def fset(self, value):
+        swarm = self._swarm
+        column = getattr(swarm, name)
+        if not swarm.broken.item(self._row):
+            setattr(swarm, total, getattr(swarm, total) + value - column.item(self._row))
+        column[self._row] = value
+
+    return property(fget, fset)
+
+
+def broken_column():
+    """Broken flag, breaking a robot removes it from the running totals"""
+
+    def fget(self):
+        return self._swarm.broken.item(self._row)
+
+    def fset(self, value):
+        self._swarm.set_broken(self._row, bool(value))
+
+    return property(fget, fset)
+
+
+def position_column():
+    """Global position, [] until it is known and [x, y] afterwards"""
+
+    def fget(self):
+        if not self._swarm.has_position.item(self._row):
+            return []
+        return self._swarm.position[self._row].tolist()
+
+    def fset(self, value):
+        self._swarm.set_position(self._row, value)
+
+    return property(fget, fset)
+
+
+def role_column():
+    return coded_column("role", _ROLE_CODES, ROLES)
+
+
+def led_column():
+    return coded_column("led", _LED_CODES, LED_COLORS)
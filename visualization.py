@@ -0,0 +1,122 @@
+from pathlib import Path
+import numpy as np
+from mesa.visualization.ModularVisualization import VisualizationElement
+from constant import State, LED_COLORS
+
+# --- DELTA CANVAS ---
+# The browser keeps the color and label of every robot and the server only sends
+# the robots that changed since the previous frame:
+#   keyframe: {"key": true, "x": [...], "y": [...], "c": [...], "t": [...]}  (every robot, by row)
+#   delta:    {"key": false, "i": [rows], "c": [...], "t": [...]}            (changed robots only)
+# "c" are LED codes (index in LED_COLORS, sent once with the module) and "t" the labels.
+
+_POSITION_STATES = (State.SR2A_ORIGIN_SET_POSITION, State.SR2B_SET_RELATIVE_POS, State.SR2C_SET_GLOBAL_POS)
+_SWARM_STATES = (State.SR1A_ID_ASSIGNMENT, State.SR2B_SET_REC_DIMENSION,
+                 State.SET_ANIMATION_SINCRONIZATION, State.SET_ROLE_COLOR) + _POSITION_STATES
+
+
+def label_keys(model):
+    """
+    (state, a, b, has_position) of every robot, the values its label is made of:
+    two frames with the same key show the same label, so only changed keys are formatted
+    """
+
+    swarm = model.swarm
+    n = swarm.size
+    state = swarm.state[:n]
+    keys = np.zeros((n, 4), dtype=np.int64)
+    keys[:, 0] = state
+
+    assigning = state == State.SR1A_ID_ASSIGNMENT
+    keys[assigning, 1] = swarm.my_id[:n][assigning]
+    counting = state == State.SR2B_SET_REC_DIMENSION
+    keys[counting, 1] = swarm.count[:n][counting]
+    positioned = np.isin(state, _POSITION_STATES)
+    keys[positioned, 1:3] = swarm.position[:n][positioned]
+    keys[positioned, 3] = swarm.has_position[:n][positioned]
+
+    # The other labels come from Kilobot attributes
+    for row in np.flatnonzero(~np.isin(state, _SWARM_STATES)):
+        agent = model.kilobots[row]
+        if state[row] == State.SR2A_ORIGIN_ASSIGNMENT:
+            keys[row, 1] = agent.numOriginAssigment
+        else:
+            keys[row, 1] = len(agent.neighbor_ids)
+    return keys
+
+
+def label_text(key):
+    """Label of a robot from its key (the same text as server.agent_portrayal)"""
+
+    state, a, b, has_position = (int(value) for value in key)
+    if state in (State.SR1A_ID_ASSIGNMENT, State.SR2A_ORIGIN_ASSIGNMENT, State.SR2B_SET_REC_DIMENSION):
+        return str(a)
+    if state == State.SR2A_ORIGIN_SET_POSITION:
+        return str([a, b] if has_position else [])
+    if state in _POSITION_STATES:
+        return str([a, b]) if has_position else ""
+    if state in (State.SET_ANIMATION_SINCRONIZATION, State.SET_ROLE_COLOR):
+        return ""
+    return str(a) if a > 0 else ""
+
+
+class DeltaCanvasGrid(VisualizationElement):
+    """CanvasGrid for the kilobots that only sends the robots whose color or label changed"""
+
+    local_includes = ["DeltaCanvasModule.js"]
+    local_dir = str(Path(__file__).resolve().parent)
+
+    def __init__(self, grid_width, grid_height, canvas_width=500, canvas_height=500, radius=0.8, text_color="white"):
+        super().__init__()
+        self.js_code = "elements.push(new DeltaCanvasModule({}, {}, {}, {}, {}, {}, {}));".format(
+            canvas_width, canvas_height, grid_width, grid_height, radius,
+            list(LED_COLORS), f'"{text_color}"'
+        )
+        self._model = None   # Model and step of the last frame sent
+        self._step = None
+        self._colors = None
+        self._keys = None
+
+    def snapshot(self, model):
+        """LED codes and label keys of every robot, by row"""
+        return model.swarm.led[:model.swarm.size].copy(), label_keys(model)
+
+    def positions(self, model):
+        return [agent.pos[0] for agent in model.kilobots], [agent.pos[1] for agent in model.kilobots]
+
+    def render(self, model):
+        colors, keys = self.snapshot(model)
+        n = len(colors)
+
+        # A new model (reset) or a step already sent (page reload) needs every robot
+        keyframe = model is not self._model or model.schedule.steps <= self._step
+        if keyframe:
+            rows = np.arange(n)
+        else:
+            rows = np.flatnonzero((colors != self._colors) | (keys != self._keys).any(axis=1))
+
+        frame = {
+            "key": keyframe,
+            "c": colors[rows].tolist(),
+            "t": [label_text(key) for key in keys[rows]],
+        }
+        if keyframe:
+            frame["x"], frame["y"] = self.positions(model)
+        else:
+            frame["i"] = rows.tolist()
+
+        self._model, self._step = model, model.schedule.steps
+        self._colors, self._keys = colors, keys
+        return frame
+
+
+class ReplayCanvasGrid(DeltaCanvasGrid):
+    """DeltaCanvasGrid of a recording.ReplayModel: the recorded LED colors, without labels"""
+
+    def snapshot(self, model):
+        keys = np.zeros((model.recording.robots, 4), dtype=np.int64)
+        keys[:, 0] = State.SET_ROLE_COLOR  # No label
+        return np.array(model.frame()), keys
+
+    def positions(self, model):
+        return model.recording.meta["x"], model.recording.meta["y"]
@@ -0,0 +1,169 @@
+import json
+import os
+import socket
+import sys
+import time
+from multiprocessing import Pool
+from pathlib import Path
+from cache import ResultCache, cell_key, code_version, expand_parameters, run_cell
+
+# --- FILESYSTEM WORK QUEUE ---
+# A sweep is a directory shared by every host (NFS, SMB...):
+#   pending/<key>.json            work items nobody has taken yet
+#   claimed/<key>.json.<worker>   items being run by a worker
+#   done/<key>.json               the result row of every finished item
+# A worker claims an item by renaming it from pending/ to claimed/: rename is
+# atomic, so only one worker can win it. Results are written to a temporary
+# file and renamed into done/, readers never see a half-written row.
+# The mtime of a claimed file is the time it was claimed: once pending/ is
+# empty, workers started with a stale timeout put back the items claimed
+# longer ago than that (their worker died). The timeout has to be longer than a run.
+
+PENDING, CLAIMED, DONE = "pending", "claimed", "done"
+
+
+def worker_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _write_atomic(path, content):
+    temporary = path.with_name(f".{path.name}.{worker_name()}.tmp")
+    with open(temporary, "w") as file:
+        json.dump(content, file, default=lambda value: value.item() if hasattr(value, "item") else str(value))
+    os.replace(temporary, path)
+
+
+class WorkQueue:
+    """Work items of a sweep (one per parameter combination) in a shared directory"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        for name in (PENDING, CLAIMED, DONE):
+            (self.directory / name).mkdir(parents=True, exist_ok=True)
+
+    def _keys(self, name):
+        return {path.name.split(".")[0] for path in (self.directory / name).iterdir() if not path.name.startswith(".")}
+
+    def submit(self, parameters, max_steps=1000):
+        """Add a work item for every combination of the parameters (like batch_run) that isn't queued or done yet"""
+
+        version = code_version()
+        queued = self._keys(PENDING) | self._keys(CLAIMED) | self._keys(DONE)
+        added = 0
+        for run_id, kwargs in enumerate(expand_parameters(parameters)):
+            key = cell_key(kwargs, max_steps, version)
+            if key not in queued:
+                item = {"key": key, "run_id": run_id, "kwargs": kwargs, "max_steps": max_steps, "code": version}
+                _write_atomic(self.directory / PENDING / f"{key}.json", item)
+                added += 1
+        return added
+
+    def claim(self, worker=None):
+        """Take a pending item (None when there are none left), with the path of its claimed file"""
+
+        worker = worker or worker_name()
+        for path in sorted((self.directory / PENDING).glob("*.json")):
+            claimed = self.directory / CLAIMED / f"{path.name}.{worker}"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # Another worker won it
+            os.utime(claimed)  # rename keeps the submission time, requeue_stale needs the claim time
+            with open(claimed) as file:
+                return json.load(file), claimed
+        return None
+
+    def complete(self, item, claimed, row):
+        _write_atomic(self.directory / DONE / f"{item['key']}.json", row)
+        claimed.unlink(missing_ok=True)
+
+    def release(self, claimed):
+        """Put a claimed item back in pending/ (its worker can't run it)"""
+
+        key = claimed.name.split(".")[0]
+        os.replace(claimed, self.directory / PENDING / f"{key}.json")
+
+    def requeue_stale(self, timeout):
+        """Put back in pending/ the items claimed more than 'timeout' seconds ago (their worker probably died)"""
+
+        now = time.time()
+        requeued = 0
+        for claimed in (self.directory / CLAIMED).iterdir():
+            try:
+                if now - claimed.stat().st_mtime > timeout:
+                    self.release(claimed)
+                    requeued += 1
+            except FileNotFoundError:
+                continue  # Completed or requeued meanwhile
+        return requeued
+
+    def status(self):
+        return {name: len(self._keys(name)) for name in (PENDING, CLAIMED, DONE)}
+
+    def results(self):
+        """Rows of the finished items (the same rows as cache.iter_batch_run)"""
+
+        for path in sorted((self.directory / DONE).glob("*.json")):
+            with open(path) as file:
+                yield json.load(file)
+
+
+def work(directory, model_cls, cache=None, worker=None, stale_after=None):
+    """
+    Claim and run items until the queue is empty. Returns the number of items run.
+    With 'stale_after' (seconds), the items claimed longer ago than that are put back
+    in pending/ and run when nothing else is pending.
+    """
+
+    queue = WorkQueue(directory)
+    cache = cache or ResultCache()
+    version = code_version()
+    worker = worker or worker_name()
+    runs = 0
+
+    while True:
+        claimed_item = queue.claim(worker)
+        if claimed_item is None:
+            # Nothing pending: take back the items of dead workers, if any
+            if stale_after is None or queue.requeue_stale(stale_after) == 0:
+                break
+            continue
+        item, claimed = claimed_item
+        if item["code"] != version:
+            # Another host submitted it with different model code: its results wouldn't match the key
+            queue.release(claimed)
+            raise RuntimeError(f"Item {item['key']} was submitted with code {item['code']}, this worker runs {version}")
+
+        kwargs = item["kwargs"]
+        results = cache.get(item["key"])
+        if results is None:
+            _, results = run_cell(model_cls, item["max_steps"], (item["run_id"], kwargs))
+            if kwargs.get("seed") is not None:
+                cache.put(item["key"], kwargs, results)
+
+        row = {"RunId": item["run_id"], "iteration": 0, **kwargs, **results, "RunKey": item["key"], "Code": version}
+        queue.complete(item, claimed, row)
+        runs += 1
+    return runs
+
+
+def _work_process(directory, index, stale_after):
+    from model import KilobotFormationModel
+    return work(directory, KilobotFormationModel, worker=f"{worker_name()}-{index}", stale_after=stale_after)
+
+
+def work_locally(directory, number_processes=None, stale_after=None):
+    """Run 'number_processes' workers on this machine (a stand-in for a cluster of hosts)"""
+
+    number_processes = number_processes or os.cpu_count()
+    with Pool(number_processes) as pool:
+        return sum(pool.starmap(_work_process, [(directory, index, stale_after) for index in range(number_processes)]))
+
+
+if __name__ == "__main__":
+    # Start the workers of a host:  python workqueue.py <queue directory> [number of processes] [stale timeout (s)]
+    if len(sys.argv) < 2:
+        sys.exit("Usage: python workqueue.py <queue directory> [number of processes] [stale timeout (s)]")
+    processes = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    stale_after = float(sys.argv[3]) if len(sys.argv) > 3 else None
+    print(f"{work_locally(sys.argv[1], processes, stale_after)} runs done, queue: {WorkQueue(sys.argv[1]).status()}")